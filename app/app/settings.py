@@ -43,6 +43,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'core',
     'rest_framework',
     'rest_framework.authtoken',
@@ -52,6 +53,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # first, so its timings cover the rest of the stack
+    'core.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -89,13 +92,74 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
         'HOST': os.environ.get('DB_HOST'),
+        'PORT': os.environ.get('DB_PORT', ''),
         'USER': os.environ.get('DB_USER'),
         'NAME': os.environ.get('DB_NAME'),
-        'PASSWORD': os.environ.get('DB_PASS')
+        'PASSWORD': os.environ.get('DB_PASS'),
+        # seconds a connection is reused across requests, 0 closes it after
+        # every request
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        # ping reused connections when a request starts (core.db)
+        'CONN_HEALTH_CHECKS': bool(
+            int(os.environ.get('DB_CONN_HEALTH_CHECKS', 1))
+        ),
+        # behind PgBouncer in transaction mode a named cursor can outlive
+        # the server connection it was opened on, so iterator() falls back
+        # to client side cursors
+        'DISABLE_SERVER_SIDE_CURSORS': bool(
+            int(os.environ.get('DB_PGBOUNCER', 0))
+        ),
     }
 
 }
 
+# read replicas, comma separated hosts sharing the primary's credentials.
+# Point one at DB_HOST to try the routing locally
+DATABASE_REPLICAS = []
+for index, host in enumerate(
+    filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(','))
+):
+    alias = f'replica{index + 1}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': host.strip(),
+        # tests run against the primary's test database
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+# seconds a user's reads stay on the primary after they wrote, so replica
+# lag never shows them (or caches) their own stale data
+DATABASE_REPLICA_PIN_SECONDS = int(
+    os.environ.get('DB_REPLICA_PIN_SECONDS', 5)
+)
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # recipe api responses, use a shared backend (file or db) when running
+    # more than one worker so invalidations reach every process
+    'recipes': {
+        'BACKEND': os.environ.get(
+            'RECIPE_CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache',
+        ),
+        'LOCATION': os.environ.get('RECIPE_CACHE_LOCATION', 'recipes'),
+        'TIMEOUT': int(os.environ.get('RECIPE_CACHE_TIMEOUT', 300)),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('RECIPE_CACHE_MAX_ENTRIES', 10000)),
+        },
+    },
+}
+
+RECIPE_CACHE_ALIAS = 'recipes'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -115,6 +179,35 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# hasher for new passwords, argon2 or pbkdf2. Hashes made with the other
+# one, or with other costs, are replaced when their user next logs in
+PASSWORD_HASHERS = {
+    'argon2': [
+        'user.hashers.Argon2PasswordHasher',
+        'user.hashers.PBKDF2PasswordHasher',
+    ],
+    'pbkdf2': [
+        'user.hashers.PBKDF2PasswordHasher',
+        'user.hashers.Argon2PasswordHasher',
+    ],
+}[os.environ.get('PASSWORD_HASHER', 'argon2')] + [
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+]
+# django's argon2 defaults (2 passes over 100 MiB, 8 lanes) cost more than
+# pbkdf2. These are the OWASP minimum, about 4x cheaper than pbkdf2's
+# 260000 iterations per login and on a single core
+PASSWORD_ARGON2_TIME_COST = int(os.environ.get('PASSWORD_ARGON2_TIME_COST', 2))
+PASSWORD_ARGON2_MEMORY_COST = int(
+    os.environ.get('PASSWORD_ARGON2_MEMORY_COST', 19 * 1024)
+)
+PASSWORD_ARGON2_PARALLELISM = int(
+    os.environ.get('PASSWORD_ARGON2_PARALLELISM', 1)
+)
+PASSWORD_PBKDF2_ITERATIONS = int(
+    os.environ.get('PASSWORD_PBKDF2_ITERATIONS', 260000)
+)
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/3.2/topics/i18n/
@@ -134,11 +227,43 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/3.2/howto/static-files/
 
 STATIC_URL = '/static/static/'
-MEDIA_URL = '/static/media/'
+# served by recipe.views.MediaView after checking who asks
+MEDIA_URL = '/api/media/'
 
 STATIC_ROOT = '/vol/web/static'
 MEDIA_ROOT = '/vol/web/media'
 
+# internal nginx location aliasing MEDIA_ROOT, see proxy/default.conf.tpl,
+# empty makes django send the files itself (runserver has no proxy)
+MEDIA_ACCEL_REDIRECT_URL = os.environ.get(
+    'MEDIA_ACCEL_REDIRECT_URL',
+    '' if DEBUG else '/protected/media/',
+)
+# browser cache lifetime of authorized media responses
+MEDIA_CACHE_SECONDS = int(os.environ.get('MEDIA_CACHE_SECONDS', 86400))
+
+# images resized on request (MEDIA_URL?width=), kept in a least recently
+# used disk cache on the shared volume, not under the public static alias
+IMAGE_RESIZE_CACHE_DIR = os.environ.get(
+    'IMAGE_RESIZE_CACHE_DIR', '/vol/web/cache/images'
+)
+IMAGE_RESIZE_CACHE_MAX_BYTES = int(
+    os.environ.get('IMAGE_RESIZE_CACHE_MAX_BYTES', 1024 ** 3)
+)
+# requested widths are rounded up to one of these (the largest caps them)
+IMAGE_RESIZE_WIDTHS = [
+    int(width) for width in os.environ.get(
+        'IMAGE_RESIZE_WIDTHS', '150,300,600,900,1200,1600,2000'
+    ).split(',')
+]
+IMAGE_RESIZE_CACHE_SECONDS = int(
+    os.environ.get('IMAGE_RESIZE_CACHE_SECONDS', 365 * 86400)
+)
+IMAGE_RESIZE_ACCEL_REDIRECT_URL = os.environ.get(
+    'IMAGE_RESIZE_ACCEL_REDIRECT_URL',
+    '' if DEBUG else '/protected/resized/',
+)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -148,8 +273,58 @@ AUTH_USER_MODEL = 'core.User'
 
 REST_FRAMEWORK = {
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
+    # clients are identified by REMOTE_ADDR, which nginx sets. Raise it
+    # when more proxies add X-Forwarded-For, clients can forge the header
+    "NUM_PROXIES": int(os.environ.get('API_NUM_PROXIES', 0)),
+    "DEFAULT_THROTTLE_RATES": {
+        'login_ip': os.environ.get('LOGIN_THROTTLE_IP_RATE', '30/min'),
+        'login_email': os.environ.get('LOGIN_THROTTLE_EMAIL_RATE', '5/min'),
+        # resizes per user that missed the rendition cache
+        'image_resize': os.environ.get('IMAGE_RESIZE_THROTTLE_RATE', '30/min'),
+    },
 }
 
+# background threads per worker resizing uploaded recipe images,
+# 0 processes them inline after the upload commits
+IMAGE_PROCESSING_WORKERS = int(os.environ.get('IMAGE_PROCESSING_WORKERS', 2))
+
+# unreferenced recipe images younger than this are left for a later
+# gc_recipe_images run, they may belong to an upload still committing
+IMAGE_GC_GRACE_SECONDS = int(os.environ.get('IMAGE_GC_GRACE_SECONDS', 600))
+# partial uploads untouched for longer were abandoned by a crashed worker
+# and are deleted by gc_recipe_images
+IMAGE_UPLOAD_TEMP_GRACE_SECONDS = int(
+    os.environ.get('IMAGE_UPLOAD_TEMP_GRACE_SECONDS', 3600)
+)
+
+# uploaded recipe images with more pixels are rejected from their header,
+# before the rest of the file is received
+IMAGE_UPLOAD_MAX_PIXELS = int(
+    os.environ.get('IMAGE_UPLOAD_MAX_PIXELS', 50_000_000)
+)
+
+# in-process token -> user cache used by CachedTokenAuthentication
+TOKEN_AUTH_CACHE_SIZE = int(os.environ.get('TOKEN_AUTH_CACHE_SIZE', 10000))
+TOKEN_AUTH_CACHE_TTL = int(os.environ.get('TOKEN_AUTH_CACHE_TTL', 60))
+
+# cursor pagination for the recipe list endpoints
+API_PAGE_SIZE = int(os.environ.get('API_PAGE_SIZE', 100))
+API_MAX_PAGE_SIZE = int(os.environ.get('API_MAX_PAGE_SIZE', 1000))
+
+# seconds a readiness result is reused before the checks run again
+HEALTH_CHECK_CACHE_TTL = float(os.environ.get('HEALTH_CHECK_CACHE_TTL', 2))
+
+# bearer token the Prometheus scraper sends to /api/metrics/, the endpoint
+# refuses every request while it is unset
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# /api/recipe/recipes/bulk/ request size and rows per INSERT/UPDATE
+RECIPE_BULK_MAX_ITEMS = int(os.environ.get('RECIPE_BULK_MAX_ITEMS', 1000))
+RECIPE_BULK_BATCH_SIZE = int(os.environ.get('RECIPE_BULK_BATCH_SIZE', 500))
+
+# rows per server-side cursor fetch (and prefetch) when streaming exports
+RECIPE_EXPORT_CHUNK_SIZE = int(os.environ.get('RECIPE_EXPORT_CHUNK_SIZE', 500))
+
 SPECTACULAR_SETTINGS = {
     'COMPONENT_SPLIT_REQUEST': True,
 }
\ No newline at end of file
@@ -15,10 +15,9 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
-from django.conf.urls.static import static
-from django.conf import settings
 
 from core import views as core_views
+from recipe.views import MediaView
 
 from drf_spectacular.views import(
     SpectacularAPIView,
@@ -36,10 +35,13 @@ urlpatterns = [
     path('api/user/', include('user.urls')),
     path('api/recipe/', include('recipe.urls')),
     path('api/health-check/', core_views.health_check, name='health-check'),
+    path('api/health-check/live/', core_views.liveness, name='health-live'),
+    path(
+        'api/health-check/ready/',
+        core_views.readiness_check,
+        name='health-ready',
+    ),
+    path('api/metrics/', core_views.metrics, name='metrics'),
+    # MEDIA_URL, uploads are private to the users of the recipes
+    path('api/media/<path:name>', MediaView.as_view(), name='media'),
 ]
-
-if settings.DEBUG:
-    urlpatterns += static(
-        settings.MEDIA_URL,
-        document_root = settings.MEDIA_ROOT,
-    )
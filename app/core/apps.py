@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.core.signals import request_finished, request_started
 
 
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from core.db import check_persistent_connections
+        from core.routers import reset_state
+        # after close_old_connections, which Django connects first
+        request_started.connect(check_persistent_connections)
+        # finished fires once streamed responses are done reading
+        request_started.connect(reset_state)
+        request_finished.connect(reset_state)
@@ -0,0 +1,19 @@
+"""
+Database connection helpers
+"""
+from django.db import connections
+
+
+def check_persistent_connections(**kwargs):
+    """Close reused connections the server has dropped"""
+    # Django 3.2 has no CONN_HEALTH_CHECKS: a persistent connection killed
+    # by a database restart or idle timeout would fail the first query of
+    # the next request, so ping it before the request uses it
+    for connection in connections.all():
+        if (
+            connection.connection is not None
+            and connection.settings_dict.get('CONN_HEALTH_CHECKS')
+            and not connection.in_atomic_block
+            and not connection.is_usable()
+        ):
+            connection.close()
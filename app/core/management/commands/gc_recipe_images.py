@@ -0,0 +1,133 @@
+"""
+Django command to delete recipe images no recipe references, and uploads
+abandoned part way
+"""
+
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.models import Recipe
+from recipe.images import image_storage
+from recipe.uploads import UPLOAD_TEMP_DIR
+
+
+class Command(BaseCommand):
+    """Django command to garbage collect recipe images."""
+    help = (
+        'Delete recipe images and renditions no recipe references, and '
+        'stale partial uploads.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace',
+            type=int,
+            default=settings.IMAGE_GC_GRACE_SECONDS,
+            help='keep files modified less than this many seconds ago',
+        )
+        parser.add_argument(
+            '--upload-grace',
+            type=int,
+            default=settings.IMAGE_UPLOAD_TEMP_GRACE_SECONDS,
+            help='keep partial uploads written to less than this many '
+                 'seconds ago',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='only list what would be deleted',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        storage = image_storage()
+        root = storage.path(os.path.join('uploads', 'recipe'))
+        cutoff = time.time() - options['grace']
+
+        # the reference count of every file, only zero matters here
+        referenced = set(
+            Recipe.objects.exclude(image__isnull=True).exclude(image='')
+            .values_list('image', flat=True).distinct().iterator()
+        )
+        # renditions are named <image stem>-<rendition>.<ext>
+        referenced_stems = {
+            os.path.splitext(os.path.basename(name))[0] for name in referenced
+        }
+
+        deleted = freed = 0
+        for directory, _, filenames in os.walk(root):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, storage.location).replace(
+                    os.sep, '/'
+                )
+                if os.path.basename(directory) == 'renditions':
+                    stem = os.path.splitext(filename)[0].rsplit('-', 1)[0]
+                    in_use = stem in referenced_stems
+                else:
+                    in_use = name in referenced
+                if in_use:
+                    continue
+                size = self.delete(
+                    path,
+                    name,
+                    cutoff,
+                    options['dry_run'],
+                    # referenced again since the set was loaded
+                    lambda: Recipe.objects.filter(image=name).exists(),
+                )
+                if size is not None:
+                    deleted += 1
+                    freed += size
+
+        # the temporary files of uploads whose worker crashed or was killed,
+        # live uploads write to theirs with every chunk
+        upload_cutoff = time.time() - options['upload_grace']
+        upload_dir = storage.path(UPLOAD_TEMP_DIR)
+        try:
+            filenames = os.listdir(upload_dir)
+        except FileNotFoundError:
+            filenames = []
+        for filename in filenames:
+            if not filename.endswith('.upload'):
+                continue
+            size = self.delete(
+                os.path.join(upload_dir, filename),
+                f'{UPLOAD_TEMP_DIR}/{filename}',
+                upload_cutoff,
+                options['dry_run'],
+            )
+            if size is not None:
+                deleted += 1
+                freed += size
+
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {deleted} files, {freed / 1024 / 1024:.1f} MiB.'
+        ))
+
+    def delete(self, path, name, cutoff, dry_run, in_use=None):
+        """Delete the file at path unless modified after cutoff
+
+        Returns its size, or None when it was kept.
+        """
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        if stat.st_mtime > cutoff:
+            return None
+        if in_use is not None and in_use():
+            return None
+
+        if dry_run:
+            self.stdout.write(f'Would delete {name}')
+        else:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                return None
+        return stat.st_size
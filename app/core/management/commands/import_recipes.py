@@ -0,0 +1,330 @@
+"""
+Django command to bulk import recipes from NDJSON or CSV
+"""
+
+import csv
+import io
+import itertools
+import json
+import sys
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core.models import (
+    Recipe,
+    Tag,
+    Ingredient
+)
+from core.routers import pin_to_primary
+from recipe.cache import invalidate_user
+
+# recipe fields read from each record
+RECIPE_FIELDS = ['title', 'time_minutes', 'price', 'link', 'description']
+# columns written by COPY, search_vector is left NULL for the trigger (see
+# migration 0008) to fill in
+COPY_COLUMNS = RECIPE_FIELDS + [
+    'id', 'user_id', 'image', 'image_status', 'image_renditions', 'updated_at',
+]
+
+
+def read_ndjson(stream):
+    """Yield one record per non-blank line"""
+    for line in stream:
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # reported and skipped like any other invalid record
+                yield None
+
+
+def read_csv(stream):
+    """Yield one record per row, tags and ingredients ; separated"""
+    for row in csv.DictReader(stream):
+        for field in ('tags', 'ingredients'):
+            row[field] = (row.get(field) or '').split(';')
+        yield row
+
+
+READERS = {
+    'ndjson': read_ndjson,
+    'csv': read_csv,
+}
+
+
+def related_names(model, items):
+    """Return unique valid names from names or {'name': ...} objects"""
+    field = model._meta.get_field('name')
+    names = (
+        item['name'] if isinstance(item, dict) else item
+        for item in items or []
+    )
+    return list(dict.fromkeys(
+        field.clean(name.strip(), None) for name in names if name.strip()
+    ))
+
+
+class NameMap:
+    """In-memory name -> id map of a user's tags or ingredients"""
+
+    def __init__(self, model):
+        self.model = model
+        self._ids = {}
+
+    def get(self, user_id, name):
+        """Return the id of a resolved name"""
+        return self._ids[user_id][name]
+
+    def resolve(self, user_id, names):
+        """Load a user's names and create the missing ones in bulk"""
+        if user_id not in self._ids:
+            # one query per user and model for the whole import
+            self._ids[user_id] = dict(
+                self.model.objects.filter(user_id=user_id)
+                .values_list('name', 'id')
+            )
+        ids = self._ids[user_id]
+        missing = [name for name in dict.fromkeys(names) if name not in ids]
+        if missing:
+            self.model.objects.bulk_create(
+                [self.model(user_id=user_id, name=name) for name in missing],
+                ignore_conflicts=True,
+            )
+            ids.update(
+                self.model.objects.filter(user_id=user_id, name__in=missing)
+                .values_list('name', 'id')
+            )
+
+
+class Command(BaseCommand):
+    """Django command to bulk import recipes."""
+    help = 'Import recipes from an NDJSON or CSV file, or - for stdin.'
+    stealth_options = ('stdin',)
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='file to read, - for stdin')
+        parser.add_argument(
+            '--format',
+            choices=sorted(READERS),
+            help='input format, by default taken from the file extension',
+        )
+        parser.add_argument(
+            '--user',
+            help='email of the owner of records without a "user" field',
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--offset',
+            type=int,
+            default=0,
+            help='skip this many records, to resume an interrupted import',
+        )
+        parser.add_argument(
+            '--no-copy',
+            action='store_true',
+            help='insert with INSERT statements instead of COPY',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        path = options['path']
+        input_format = options['format']
+        if input_format is None:
+            input_format = 'csv' if path.endswith('.csv') else 'ndjson'
+        self.batch_size = options['batch_size']
+        if self.batch_size < 1:
+            # an empty first batch would end the import before reading
+            raise CommandError('--batch-size must be at least 1.')
+        self.use_copy = (
+            not options['no_copy'] and connection.vendor == 'postgresql'
+        )
+        self.users = {}
+        self.default_user = (
+            self.get_user_id(options['user']) if options['user'] else None
+        )
+        self.tags = NameMap(Tag)
+        self.ingredients = NameMap(Ingredient)
+
+        if path == '-':
+            stream = options.get('stdin', sys.stdin)
+            self.import_stream(stream, input_format, options['offset'])
+        else:
+            with open(path, newline='', encoding='utf-8') as stream:
+                self.import_stream(stream, input_format, options['offset'])
+
+    def get_user_id(self, email):
+        """Return the id of the user with email, cached for the import"""
+        if email not in self.users:
+            user_id = get_user_model().objects.filter(
+                email=email
+            ).values_list('id', flat=True).first()
+            if user_id is None:
+                raise CommandError(f'No user with email {email}.')
+            self.users[email] = user_id
+        return self.users[email]
+
+    def import_stream(self, stream, input_format, offset):
+        """Read, validate and insert records in batches"""
+        records = READERS[input_format](stream)
+        # the generator keeps only one batch in memory
+        records = itertools.islice(records, offset, None)
+        position = offset
+        imported = skipped = 0
+        started = time.monotonic()
+
+        while True:
+            batch = list(itertools.islice(records, self.batch_size))
+            if not batch:
+                break
+            rows = []
+            for number, record in enumerate(batch, start=position + 1):
+                try:
+                    rows.append(self.clean_record(record))
+                except (ValidationError, ValueError, TypeError,
+                        AttributeError, KeyError) as e:
+                    skipped += 1
+                    self.stderr.write(f'Record {number} skipped: {e}')
+            try:
+                self.insert_batch(rows)
+            except Exception:
+                self.stderr.write(
+                    f'Import stopped, resume with --offset {position}'
+                )
+                raise
+            position += len(batch)
+            imported += len(rows)
+            rate = imported / max(time.monotonic() - started, 1e-6)
+            self.stdout.write(
+                f'{position} records read, {imported} imported, '
+                f'{skipped} skipped ({rate:.0f} recipes/s)'
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {imported} recipes, skipped {skipped}.'
+        ))
+
+    def clean_record(self, record):
+        """Return (user_id, recipe values, tag names, ingredient names)"""
+        if not isinstance(record, dict):
+            raise ValueError('expected a JSON object')
+        email = record.get('user')
+        if email:
+            try:
+                user_id = self.get_user_id(email)
+            except CommandError as e:
+                raise ValueError(str(e))
+        elif self.default_user is not None:
+            user_id = self.default_user
+        else:
+            raise ValueError('no user, pass --user')
+
+        values = {}
+        for name in RECIPE_FIELDS:
+            field = Recipe._meta.get_field(name)
+            value = record.get(name)
+            if value is None and field.blank:
+                value = ''
+            try:
+                values[name] = field.clean(value, None)
+            except ValidationError as e:
+                raise ValidationError({name: e.messages})
+
+        return (
+            user_id,
+            values,
+            related_names(Tag, record.get('tags')),
+            related_names(Ingredient, record.get('ingredients')),
+        )
+
+    @transaction.atomic
+    def insert_batch(self, rows):
+        """Insert a batch of cleaned records in one transaction"""
+        if not rows:
+            return
+        for user_id, _, tags, ingredients in rows:
+            self.tags.resolve(user_id, tags)
+            self.ingredients.resolve(user_id, ingredients)
+
+        if self.use_copy:
+            recipe_ids = self.copy_recipes(rows)
+        else:
+            recipes = Recipe.objects.bulk_create(
+                [Recipe(user_id=user_id, **values)
+                 for user_id, values, _, _ in rows],
+                batch_size=self.batch_size,
+            )
+            recipe_ids = [recipe.id for recipe in recipes]
+
+        for field_name, names_index, name_map in (
+            ('tags', 2, self.tags),
+            ('ingredients', 3, self.ingredients),
+        ):
+            links = [
+                (recipe_id, name_map.get(row[0], name))
+                for recipe_id, row in zip(recipe_ids, rows)
+                for name in row[names_index]
+            ]
+            self.insert_links(field_name, links)
+
+        for user_id in {row[0] for row in rows}:
+            pin_to_primary(user_id)
+            invalidate_user(user_id)
+
+    def copy_recipes(self, rows):
+        """COPY recipe rows in with ids taken from the sequence up front"""
+        table = Recipe._meta.db_table
+        with connection.cursor() as cursor:
+            # COPY cannot return the new ids, so reserve them first
+            cursor.execute(
+                'SELECT nextval(pg_get_serial_sequence(%s, %s)) '
+                'FROM generate_series(1, %s)',
+                [table, 'id', len(rows)],
+            )
+            recipe_ids = [row[0] for row in cursor.fetchall()]
+            now = timezone.now().isoformat()
+            self.copy(cursor, table, COPY_COLUMNS, (
+                [values[name] for name in RECIPE_FIELDS]
+                + [recipe_id, user_id, '', '', '{}', now]
+                for recipe_id, (user_id, values, _, _) in zip(recipe_ids, rows)
+            ))
+
+        return recipe_ids
+
+    def insert_links(self, field_name, links):
+        """Insert (recipe id, related id) rows into a m2m table"""
+        if not links:
+            return
+        field = Recipe._meta.get_field(field_name)
+        through = field.remote_field.through
+        recipe_fk = f'{field.m2m_field_name()}_id'
+        related_fk = f'{field.m2m_reverse_field_name()}_id'
+        if self.use_copy:
+            with connection.cursor() as cursor:
+                self.copy(
+                    cursor, through._meta.db_table, [recipe_fk, related_fk],
+                    links,
+                )
+        else:
+            through.objects.bulk_create(
+                [through(**{recipe_fk: recipe_id, related_fk: related_id})
+                 for recipe_id, related_id in links],
+                batch_size=self.batch_size,
+            )
+
+    def copy(self, cursor, table, columns, rows):
+        """Stream rows to a table with COPY ... FROM STDIN"""
+        buffer = io.StringIO()
+        # every value quoted, so empty strings are not read as NULL
+        csv.writer(buffer, quoting=csv.QUOTE_ALL).writerows(rows)
+        buffer.seek(0)
+        quote = connection.ops.quote_name
+        cursor.copy_expert(
+            f'COPY {quote(table)} ({", ".join(map(quote, columns))}) '
+            'FROM STDIN WITH (FORMAT csv)',
+            buffer,
+        )
@@ -0,0 +1,138 @@
+"""
+Django command to seed synthetic data for benchmarks
+"""
+
+import random
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from core.models import (
+    Recipe,
+    Tag,
+    Ingredient
+)
+
+WORDS = [
+    'chicken', 'beef', 'tofu', 'salmon', 'rice', 'pasta', 'noodle', 'bean',
+    'lentil', 'potato', 'tomato', 'garlic', 'ginger', 'lemon', 'chili',
+    'curry', 'soup', 'salad', 'stew', 'roast', 'grilled', 'spicy', 'sweet',
+    'smoky', 'quick', 'creamy', 'crispy', 'baked', 'fried', 'vegan',
+]
+
+
+def zipf_weights(count):
+    """Return weights where the i-th item is 1/(i+1) as likely as the first"""
+    return [1 / (i + 1) for i in range(count)]
+
+
+class Command(BaseCommand):
+    """Django command to seed benchmark data."""
+    help = 'Create users, recipes, tags and ingredients for benchmarks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument(
+            '--recipes',
+            type=int,
+            default=10000,
+            help='total recipes, spread unevenly over the users',
+        )
+        parser.add_argument('--tags', type=int, default=50,
+                            help='tags per user')
+        parser.add_argument('--ingredients', type=int, default=200,
+                            help='ingredients per user')
+        parser.add_argument('--password', default='benchpass123')
+        parser.add_argument('--email-prefix', default='bench')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        rng = random.Random(options['seed'])
+        batch_size = options['batch_size']
+        # hashing once instead of per user
+        password = make_password(options['password'])
+        users = get_user_model().objects.bulk_create([
+            get_user_model()(
+                email=f'{options["email_prefix"]}{i}@example.com',
+                name=f'Benchmark user {i}',
+                password=password,
+            )
+            for i in range(options['users'])
+        ])
+
+        tags = {}
+        ingredients = {}
+        for user in users:
+            tags[user.id] = Tag.objects.bulk_create(
+                [Tag(user=user, name=f'{word} {i}') for i, word in
+                 enumerate(rng.choices(WORDS, k=options['tags']))],
+                batch_size=batch_size,
+            )
+            ingredients[user.id] = Ingredient.objects.bulk_create(
+                [Ingredient(user=user, name=f'{word} {i}') for i, word in
+                 enumerate(rng.choices(WORDS, k=options['ingredients']))],
+                batch_size=batch_size,
+            )
+
+        # a few heavy accounts and a long tail of small ones
+        owners = rng.choices(
+            users, zipf_weights(len(users)), k=options['recipes']
+        )
+        recipes = Recipe.objects.bulk_create(
+            [Recipe(
+                user=owner,
+                title=' '.join(rng.sample(WORDS, rng.randint(2, 5))),
+                description=' '.join(rng.choices(WORDS, k=rng.randint(0, 40))),
+                time_minutes=max(1, int(rng.lognormvariate(3.3, 0.6))),
+                price=Decimal(min(999, rng.lognormvariate(2, 0.7))).quantize(
+                    Decimal('0.01')
+                ),
+                link=rng.choice(['', 'https://example.com/recipe']),
+            ) for owner in owners],
+            batch_size=batch_size,
+        )
+
+        tag_links = []
+        ingredient_links = []
+        for recipe in recipes:
+            # popular tags and ingredients show up on most recipes
+            user_tags = tags[recipe.user_id]
+            for tag in set(rng.choices(
+                user_tags, zipf_weights(len(user_tags)), k=rng.randint(0, 5)
+            )):
+                tag_links.append((recipe.id, tag.id))
+            user_ingredients = ingredients[recipe.user_id]
+            for ingredient in set(rng.choices(
+                user_ingredients,
+                zipf_weights(len(user_ingredients)),
+                k=rng.randint(3, 12),
+            )):
+                ingredient_links.append((recipe.id, ingredient.id))
+
+        TagLink = Recipe.tags.through
+        TagLink.objects.bulk_create(
+            [TagLink(recipe_id=r, tag_id=t) for r, t in tag_links],
+            batch_size=batch_size,
+        )
+        IngredientLink = Recipe.ingredients.through
+        IngredientLink.objects.bulk_create(
+            [IngredientLink(recipe_id=r, ingredient_id=i)
+             for r, i in ingredient_links],
+            batch_size=batch_size,
+        )
+
+        with connection.cursor() as cursor:
+            # fresh statistics so the planner sees the seeded sizes
+            cursor.execute('ANALYZE')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {len(users)} users, {len(recipes)} recipes, '
+            f'{len(tag_links)} tag and {len(ingredient_links)} ingredient '
+            'links.'
+        ))
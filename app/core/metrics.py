@@ -0,0 +1,101 @@
+"""
+In-process request metrics exposed in the Prometheus text format
+"""
+import bisect
+import os
+import threading
+
+# upper bounds in seconds for request and database time
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count of observed values"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # one extra slot for values above the last bucket (+Inf)
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self):
+        """Yield (le, cumulative count) pairs including +Inf"""
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield bound, total
+        yield '+Inf', self.count
+
+
+class RequestMetrics:
+    """Per endpoint histograms of wall time, db time and query count"""
+
+    METRICS = (
+        ('http_request_duration_seconds', 'Request wall time',
+         DURATION_BUCKETS),
+        ('http_request_db_duration_seconds', 'Time spent in database queries',
+         DURATION_BUCKETS),
+        ('http_request_db_queries', 'Database queries per request',
+         QUERY_COUNT_BUCKETS),
+    )
+
+    def __init__(self):
+        # (endpoint, method) -> histograms in METRICS order
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, endpoint, method, duration, db_duration, queries):
+        key = (endpoint, method)
+        with self._lock:
+            histograms = self._histograms.get(key)
+            if histograms is None:
+                histograms = self._histograms[key] = [
+                    Histogram(buckets) for _, _, buckets in self.METRICS
+                ]
+            for histogram, value in zip(
+                histograms, (duration, db_duration, queries)
+            ):
+                histogram.observe(value)
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def render(self):
+        """Return every histogram in the Prometheus text format"""
+        lines = []
+        # a scrape reaches one of the uwsgi workers, labelling the series
+        # with its pid keeps each of them only going up
+        pid = os.getpid()
+        with self._lock:
+            items = sorted(self._histograms.items())
+            for index, (name, help_text, _) in enumerate(self.METRICS):
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for (endpoint, method), histograms in items:
+                    histogram = histograms[index]
+                    labels = (
+                        f'pid="{pid}",endpoint="{endpoint}",method="{method}"'
+                    )
+                    for bound, count in histogram.samples():
+                        lines.append(
+                            f'{name}_bucket{{{labels},le="{bound}"}} {count}'
+                        )
+                    lines.append(f'{name}_sum{{{labels}}} {histogram.sum}')
+                    lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+
+        return '\n'.join(lines) + '\n'
+
+
+# per process: each worker reports the requests it served itself, sum
+# over the pid label to aggregate them
+request_metrics = RequestMetrics()
@@ -0,0 +1,59 @@
+"""
+Middleware for app.
+"""
+import contextlib
+import time
+
+from django.db import connections
+
+from core.metrics import request_metrics
+
+# anything else is reported as OTHER to keep the label set small
+HTTP_METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+
+class QueryCounter:
+    """execute_wrapper counting queries and the time spent in them"""
+
+    def __init__(self):
+        self.queries = 0
+        self.duration = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.queries += 1
+
+
+class RequestMetricsMiddleware:
+    """Record wall time, db time and query count per resolved url name"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = QueryCounter()
+        start = time.perf_counter()
+        with contextlib.ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(counter))
+            # streamed bodies are produced after this returns and are not
+            # included in the numbers
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        match = request.resolver_match
+        endpoint = match.view_name if match is not None else 'unmatched'
+        method = request.method if request.method in HTTP_METHODS else 'OTHER'
+        request_metrics.observe(
+            endpoint,
+            method,
+            duration,
+            counter.duration,
+            counter.queries,
+        )
+
+        return response
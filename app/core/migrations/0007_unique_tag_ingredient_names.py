@@ -0,0 +1,53 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:29
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicate_names(apps, schema_editor):
+    """Merge existing tags/ingredients that share a name for one user"""
+    Recipe = apps.get_model('core', 'Recipe')
+    for model_name, field_name in (('Tag', 'tags'), ('Ingredient', 'ingredients')):
+        model = apps.get_model('core', model_name)
+        field = Recipe._meta.get_field(field_name)
+        through = field.remote_field.through
+        related_fk = field.m2m_reverse_field_name()
+
+        duplicates = model.objects.values('user_id', 'name').annotate(
+            keep_id=Min('id'),
+            total=Count('id'),
+        ).filter(total__gt=1)
+        for duplicate in duplicates:
+            others = model.objects.filter(
+                user_id=duplicate['user_id'],
+                name=duplicate['name'],
+            ).exclude(id=duplicate['keep_id'])
+            recipe_ids = through.objects.filter(
+                **{f'{related_fk}__in': others}
+            ).values_list('recipe_id', flat=True)
+            through.objects.bulk_create(
+                [through(recipe_id=recipe_id,
+                         **{f'{related_fk}_id': duplicate['keep_id']})
+                 for recipe_id in set(recipe_ids)],
+                ignore_conflicts=True,
+            )
+            others.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_recipe_image'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_names, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('user', 'name'), name='unique_ingredient_name_per_user'),
+        ),
+        migrations.AddConstraint(
+            model_name='tag',
+            constraint=models.UniqueConstraint(fields=('user', 'name'), name='unique_tag_name_per_user'),
+        ),
+    ]
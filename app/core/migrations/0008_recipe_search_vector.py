@@ -0,0 +1,137 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:35
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+# search_vector is recomputed by a BEFORE trigger on core_recipe, and the
+# m2m / rename triggers reset it to NULL on linked recipes so it is rebuilt
+# with the current tag and ingredient names.
+SEARCH_TRIGGERS_SQL = """
+CREATE FUNCTION core_recipe_search_vector(bigint, text, text)
+RETURNS tsvector AS $$
+    SELECT
+        setweight(to_tsvector('english', coalesce($2, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce((
+            SELECT string_agg(t.name, ' ')
+            FROM core_tag t
+            JOIN core_recipe_tags rt ON rt.tag_id = t.id
+            WHERE rt.recipe_id = $1
+        ), '')), 'B') ||
+        setweight(to_tsvector('english', coalesce((
+            SELECT string_agg(i.name, ' ')
+            FROM core_ingredient i
+            JOIN core_recipe_ingredients ri ON ri.ingredient_id = i.id
+            WHERE ri.recipe_id = $1
+        ), '')), 'B') ||
+        setweight(to_tsvector('english', coalesce($3, '')), 'C');
+$$ LANGUAGE sql STABLE;
+
+CREATE FUNCTION core_recipe_search_vector_trigger() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := core_recipe_search_vector(
+        NEW.id, NEW.title, NEW.description
+    );
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER core_recipe_search_vector_update
+    BEFORE INSERT OR UPDATE OF title, description, search_vector
+    ON core_recipe
+    FOR EACH ROW EXECUTE FUNCTION core_recipe_search_vector_trigger();
+
+CREATE FUNCTION core_recipe_links_changed() RETURNS trigger AS $$
+BEGIN
+    UPDATE core_recipe SET search_vector = NULL
+    WHERE id IN (SELECT recipe_id FROM changed_links);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER core_recipe_tags_insert
+    AFTER INSERT ON core_recipe_tags
+    REFERENCING NEW TABLE AS changed_links
+    FOR EACH STATEMENT EXECUTE FUNCTION core_recipe_links_changed();
+CREATE TRIGGER core_recipe_tags_delete
+    AFTER DELETE ON core_recipe_tags
+    REFERENCING OLD TABLE AS changed_links
+    FOR EACH STATEMENT EXECUTE FUNCTION core_recipe_links_changed();
+CREATE TRIGGER core_recipe_ingredients_insert
+    AFTER INSERT ON core_recipe_ingredients
+    REFERENCING NEW TABLE AS changed_links
+    FOR EACH STATEMENT EXECUTE FUNCTION core_recipe_links_changed();
+CREATE TRIGGER core_recipe_ingredients_delete
+    AFTER DELETE ON core_recipe_ingredients
+    REFERENCING OLD TABLE AS changed_links
+    FOR EACH STATEMENT EXECUTE FUNCTION core_recipe_links_changed();
+
+CREATE FUNCTION core_tag_renamed() RETURNS trigger AS $$
+BEGIN
+    UPDATE core_recipe SET search_vector = NULL
+    WHERE id IN (
+        SELECT recipe_id FROM core_recipe_tags WHERE tag_id = NEW.id
+    );
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER core_tag_renamed
+    AFTER UPDATE OF name ON core_tag
+    FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name)
+    EXECUTE FUNCTION core_tag_renamed();
+
+CREATE FUNCTION core_ingredient_renamed() RETURNS trigger AS $$
+BEGIN
+    UPDATE core_recipe SET search_vector = NULL
+    WHERE id IN (
+        SELECT recipe_id FROM core_recipe_ingredients
+        WHERE ingredient_id = NEW.id
+    );
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER core_ingredient_renamed
+    AFTER UPDATE OF name ON core_ingredient
+    FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name)
+    EXECUTE FUNCTION core_ingredient_renamed();
+
+-- backfill existing recipes
+UPDATE core_recipe SET search_vector = NULL;
+"""
+
+DROP_SEARCH_TRIGGERS_SQL = """
+DROP TRIGGER core_ingredient_renamed ON core_ingredient;
+DROP TRIGGER core_tag_renamed ON core_tag;
+DROP TRIGGER core_recipe_ingredients_delete ON core_recipe_ingredients;
+DROP TRIGGER core_recipe_ingredients_insert ON core_recipe_ingredients;
+DROP TRIGGER core_recipe_tags_delete ON core_recipe_tags;
+DROP TRIGGER core_recipe_tags_insert ON core_recipe_tags;
+DROP TRIGGER core_recipe_search_vector_update ON core_recipe;
+DROP FUNCTION core_ingredient_renamed();
+DROP FUNCTION core_tag_renamed();
+DROP FUNCTION core_recipe_links_changed();
+DROP FUNCTION core_recipe_search_vector_trigger();
+DROP FUNCTION core_recipe_search_vector(bigint, text, text);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_unique_tag_ingredient_names'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunSQL(SEARCH_TRIGGERS_SQL, DROP_SEARCH_TRIGGERS_SQL),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='recipe_search_vector_idx'),
+        ),
+    ]
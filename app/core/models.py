@@ -5,6 +5,8 @@ import uuid
 import os
 
 from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.contrib.auth.models import (
     AbstractBaseUser,
     BaseUserManager,
@@ -12,12 +14,15 @@ from django.contrib.auth.models import (
 )
 from django.conf import settings
 
+from core.storage import content_addressed_storage
+
 
 def recipe_image_file_path(instance, filename):
     """Generate file path for new recipe image"""
     # stripping extension of filename
     ext = os.path.splitext(filename)[1]
-    # replacing filename with unique identifier
+    # replacing filename with unique identifier, recipe images are then
+    # renamed to their content hash by the storage
     filename = f'{uuid.uuid4()}{ext}'
 
     return os.path.join('uploads', 'recipe', filename)
@@ -58,6 +63,13 @@ class User(AbstractBaseUser, PermissionsMixin):
 
 class Recipe(models.Model):
     """Recipe object"""
+
+    class ImageStatus(models.TextChoices):
+        NONE = '', 'No image'
+        PENDING = 'pending', 'Pending'
+        READY = 'ready', 'Ready'
+        FAILED = 'failed', 'Failed'
+
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
@@ -70,10 +82,39 @@ class Recipe(models.Model):
     tags = models.ManyToManyField('Tag')
     ingredients = models.ManyToManyField('Ingredient')
     # reference to the function that specifies pathname
-    image = models.ImageField(null=True, upload_to=recipe_image_file_path)
+    image = models.ImageField(
+        null=True,
+        upload_to=recipe_image_file_path,
+        # identical uploads share one file, see core.storage
+        storage=content_addressed_storage,
+        # releasing a file looks up the recipes still using it
+        db_index=True,
+    )
+    # resized copies of image, written by the background image pipeline
+    image_status = models.CharField(
+        max_length=20,
+        choices=ImageStatus.choices,
+        default=ImageStatus.NONE,
+        blank=True,
+    )
+    image_renditions = models.JSONField(default=dict, blank=True)
+    # title, description, tag and ingredient names, kept up to date by
+    # database triggers (see migration 0008)
+    search_vector = SearchVectorField(null=True, editable=False)
+    # also bumped when linked tags or ingredients change
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            GinIndex(
+                fields=['search_vector'], name='recipe_search_vector_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.title
+
+
 class Tag(models.Model):
     """Tag for filtering recipes"""
     name = models.CharField(max_length=255)
@@ -81,7 +122,17 @@ class Tag(models.Model):
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE
     )
-    
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        # also the index used to look tags up by name
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'name'],
+                name='unique_tag_name_per_user',
+            ),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -92,6 +143,15 @@ class Ingredient(models.Model):
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE
     )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'name'],
+                name='unique_ingredient_name_per_user',
+            ),
+        ]
 
     def __str__(self):
         return self.name
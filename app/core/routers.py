@@ -0,0 +1,88 @@
+"""
+Database router sending safe api reads to replicas
+"""
+import random
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from rest_framework.permissions import SAFE_METHODS
+
+_state = threading.local()
+
+
+def reset_state(**kwargs):
+    """Forget the routing decisions of the previous request"""
+    _state.use_replicas = False
+    _state.pinned = False
+    _state.replica = None
+
+
+def in_transaction():
+    """Return True inside an atomic block on the primary"""
+    # replicas cannot see uncommitted rows (this includes every TestCase)
+    return connections[DEFAULT_DB_ALIAS].in_atomic_block
+
+
+def _pin_key(user_id):
+    return f'db:primary:{user_id}'
+
+
+def pin_to_primary(user_id):
+    """Read a user's data from the primary while replicas catch up a write"""
+    if settings.DATABASE_REPLICAS:
+        caches[settings.RECIPE_CACHE_ALIAS].set(
+            _pin_key(user_id),
+            True,
+            timeout=settings.DATABASE_REPLICA_PIN_SECONDS,
+        )
+
+
+class ReplicaRouter:
+    """Route reads to a replica only when a view opted in for the request"""
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if (
+            replicas
+            and getattr(_state, 'use_replicas', False)
+            and not getattr(_state, 'pinned', False)
+            and not in_transaction()
+        ):
+            # one replica for the whole request, so its queries all see the
+            # same point in time whatever the lag of each replica
+            if getattr(_state, 'replica', None) not in replicas:
+                _state.replica = random.choice(replicas)
+            return _state.replica
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # anything read after a write in the same request must see it
+        _state.pinned = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaReadMixin:
+    """Serve safe requests from replicas, unless the user just wrote"""
+
+    def initial(self, request, *args, **kwargs):
+        # authentication reads the primary, so new tokens work right away
+        super().initial(request, *args, **kwargs)
+        if not settings.DATABASE_REPLICAS:
+            return
+        user_id = request.user.id
+        if request.method in SAFE_METHODS:
+            # a user's own writes stay visible while replicas catch up
+            cache = caches[settings.RECIPE_CACHE_ALIAS]
+            _state.use_replicas = not cache.get(_pin_key(user_id))
+        else:
+            pin_to_primary(user_id)
@@ -0,0 +1,110 @@
+"""
+Content addressed and overwriting file storage
+"""
+import hashlib
+import os
+import tempfile
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Store files under the sha256 of their content
+
+    Saving bytes that are already stored returns the existing name, so
+    identical uploads share one file. The directory and extension of the
+    requested name are kept, e.g. uploads/recipe/ab/ab12...ef.jpg.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # the final name comes from the content, see _save
+        return name
+
+    def _save(self, name, content):
+        directory, filename = os.path.split(name)
+        ext = os.path.splitext(filename)[1].lower()
+        os.makedirs(self.path(directory), exist_ok=True)
+
+        if hasattr(content, 'sha256') and hasattr(
+            content, 'temporary_file_path'
+        ):
+            # hashed and written to this volume while it was uploaded, see
+            # recipe.uploads, a leftover temporary file is removed on close
+            return self._store(
+                directory,
+                ext,
+                content.sha256.hexdigest(),
+                content.temporary_file_path(),
+            )
+
+        # hash while writing to a temporary file next to the target, so
+        # the upload is read once and never held in memory
+        sha256 = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(
+            dir=self.path(directory), suffix='.tmp'
+        )
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                for chunk in content.chunks():
+                    sha256.update(chunk)
+                    tmp.write(chunk)
+            return self._store(directory, ext, sha256.hexdigest(), tmp_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _store(self, directory, ext, digest, tmp_path):
+        """Move tmp_path to the name of its digest unless already stored"""
+        name = os.path.join(directory, digest[:2], f'{digest}{ext}')
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            # a fresh mtime keeps a shared blob out of the garbage
+            # collector's reach while the new reference is committed
+            os.utime(path)
+        except FileNotFoundError:
+            if self.file_permissions_mode is not None:
+                os.chmod(tmp_path, self.file_permissions_mode)
+            # atomic rename, readers never see a partial file
+            file_move_safe(tmp_path, path, allow_overwrite=True)
+
+        return name.replace('\\', '/')
+
+
+@deconstructible
+class OverwritingStorage(FileSystemStorage):
+    """Store files under the name asked for, replacing any existing file
+
+    For derived files whose name fixes their content, like renditions:
+    concurrent writers produce the same bytes, so the last rename wins
+    instead of a second copy being kept under an alternate name.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        path = self.path(name)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                for chunk in content.chunks():
+                    tmp.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(tmp_path, self.file_permissions_mode)
+            # atomic rename, readers never see a partial file
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        return name.replace('\\', '/')
+
+
+content_addressed_storage = ContentAddressedStorage()
+overwriting_storage = OverwritingStorage()
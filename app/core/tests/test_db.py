@@ -0,0 +1,61 @@
+"""
+Tests for database connection helpers
+"""
+
+from unittest.mock import Mock, patch
+
+from django.test import SimpleTestCase
+
+from core.db import check_persistent_connections
+
+
+def fake_connection(usable=True, open=True, health_checks=True):
+    """Return a stand-in for a database connection wrapper"""
+    connection = Mock(in_atomic_block=False)
+    connection.connection = Mock() if open else None
+    connection.settings_dict = {'CONN_HEALTH_CHECKS': health_checks}
+    connection.is_usable.return_value = usable
+    return connection
+
+
+@patch('core.db.connections')
+class CheckPersistentConnectionsTests(SimpleTestCase):
+    """Test health checking reused connections"""
+
+    def test_broken_connection_closed(self, patched_connections):
+        """Test an unusable connection is closed before the request"""
+        connection = fake_connection(usable=False)
+        patched_connections.all.return_value = [connection]
+
+        check_persistent_connections()
+
+        connection.close.assert_called_once()
+
+    def test_usable_connection_kept(self, patched_connections):
+        """Test a usable connection is reused"""
+        connection = fake_connection()
+        patched_connections.all.return_value = [connection]
+
+        check_persistent_connections()
+
+        connection.is_usable.assert_called_once()
+        connection.close.assert_not_called()
+
+    def test_unopened_connection_not_checked(self, patched_connections):
+        """Test nothing is pinged when no connection is open"""
+        connection = fake_connection(open=False)
+        patched_connections.all.return_value = [connection]
+
+        check_persistent_connections()
+
+        connection.is_usable.assert_not_called()
+
+    def test_health_checks_disabled(self, patched_connections):
+        """Test CONN_HEALTH_CHECKS turns the ping off"""
+        connection = fake_connection(usable=False, health_checks=False)
+        patched_connections.all.return_value = [connection]
+
+        check_persistent_connections()
+
+        connection.is_usable.assert_not_called()
+        connection.close.assert_not_called()
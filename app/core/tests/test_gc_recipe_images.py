@@ -0,0 +1,111 @@
+"""
+Tests for the gc_recipe_images command
+"""
+
+import io
+import os
+import time
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TestCase
+
+from core.models import Recipe
+from core.tests.utils import TempMediaRootMixin
+from recipe.images import image_storage, rendition_name
+
+
+class GcRecipeImagesTests(TempMediaRootMixin, TestCase):
+    """Test garbage collecting recipe images"""
+
+    def setUp(self):
+        super().setUp()
+
+        user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+        self.recipe = Recipe.objects.create(
+            user=user,
+            title='Sample recipe',
+            time_minutes=10,
+            price=Decimal('1.00'),
+        )
+        self.storage = image_storage()
+
+    def store(self, content, age=3600):
+        """Store an image and its thumbnail, modified age seconds ago"""
+        name = self.storage.save(
+            'uploads/recipe/photo.jpg', ContentFile(content)
+        )
+        thumbnail = default_storage.save(
+            rendition_name(name, 'thumbnail', 'jpg'), ContentFile(content)
+        )
+        past = time.time() - age
+        for path in (self.storage.path(name), default_storage.path(thumbnail)):
+            os.utime(path, (past, past))
+        return name, thumbnail
+
+    def gc(self, *args):
+        out = io.StringIO()
+        call_command('gc_recipe_images', *args, stdout=out)
+        return out.getvalue()
+
+    def test_orphans_deleted(self):
+        """Test unreferenced images and renditions are deleted"""
+        used, used_thumbnail = self.store(b'used')
+        orphan, orphan_thumbnail = self.store(b'orphan')
+        self.recipe.image = used
+        self.recipe.save()
+
+        out = self.gc()
+
+        self.assertIn('Deleted 2 files', out)
+        self.assertTrue(self.storage.exists(used))
+        self.assertTrue(default_storage.exists(used_thumbnail))
+        self.assertFalse(self.storage.exists(orphan))
+        self.assertFalse(default_storage.exists(orphan_thumbnail))
+
+    def test_recent_files_kept(self):
+        """Test files younger than the grace period are kept"""
+        orphan, _ = self.store(b'orphan', age=10)
+
+        self.gc('--grace', '60')
+
+        self.assertTrue(self.storage.exists(orphan))
+
+    def test_dry_run(self):
+        """Test --dry-run only lists the files"""
+        orphan, _ = self.store(b'orphan')
+
+        out = self.gc('--dry-run')
+
+        self.assertIn(f'Would delete {orphan}', out)
+        self.assertTrue(self.storage.exists(orphan))
+
+    def test_stale_uploads_deleted(self):
+        """Test partial uploads are deleted once abandoned"""
+        directory = self.storage.path('uploads/tmp')
+        os.makedirs(directory)
+
+        def partial(filename, age):
+            path = os.path.join(directory, filename)
+            with open(path, 'wb') as f:
+                f.write(b'partial')
+            past = time.time() - age
+            os.utime(path, (past, past))
+            return path
+
+        stale = partial('stale.upload', 7200)
+        live = partial('live.upload', 10)
+        other = partial('other.txt', 7200)
+
+        out = self.gc('--upload-grace', '3600')
+
+        self.assertIn('Deleted 1 files', out)
+        self.assertFalse(os.path.exists(stale))
+        self.assertTrue(os.path.exists(live))
+        self.assertTrue(os.path.exists(other))
@@ -2,12 +2,21 @@
 Test for the health check api
 """
 
-from django.test import TestCase
+from unittest.mock import Mock, patch
+
+from django.db.utils import OperationalError
+from django.test import TestCase, override_settings
 from django.urls import reverse
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
+from core.health import readiness
+from core.tests.utils import TempMediaRootMixin
+
+
+READY_URL = reverse('health-ready')
+
 
 class HealthCheckTests(TestCase):
     """Test the health check API"""
@@ -19,4 +28,79 @@ class HealthCheckTests(TestCase):
         res = self.client.get(url)
         print(f"------------------ URL: {url}")
 
-        self.assertEqual(res.status_code, status.HTTP_200_OK)
\ No newline at end of file
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+
+class ReadinessTests(TempMediaRootMixin, TestCase):
+    """Test the liveness and readiness APIs"""
+
+    def setUp(self):
+        super().setUp()
+        readiness.clear()
+        self.addCleanup(readiness.clear)
+        self.client = APIClient()
+
+    def test_liveness(self):
+        """Test liveness succeeds without touching the database"""
+        with self.assertNumQueries(0):
+            res = self.client.get(reverse('health-live'))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    @patch('core.health._migrations_applied', False)
+    def test_ready(self):
+        """Test readiness when every dependency works"""
+        res = self.client.get(READY_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            res.data,
+            {'ready': True, 'checks': {
+                'database': 'ok', 'media': 'ok', 'migrations': 'ok',
+            }},
+        )
+
+    def test_media_not_writable(self):
+        """Test readiness fails when the media volume is missing"""
+        with override_settings(MEDIA_ROOT='/nonexistent/media'), \
+                self.assertLogs('core.health', 'ERROR'):
+            res = self.client.get(READY_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertFalse(res.data['ready'])
+        self.assertEqual(res.data['checks']['media'], 'error')
+        self.assertEqual(res.data['checks']['database'], 'ok')
+
+    def test_database_error(self):
+        """Test readiness fails when the database check raises"""
+        failing = Mock(side_effect=OperationalError('connection refused'))
+        with patch.dict(readiness.checks, {'database': failing}), \
+                self.assertLogs('core.health', 'ERROR') as logs:
+            res = self.client.get(READY_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(res.data['checks']['database'], 'error')
+        self.assertNotIn('connection refused', str(res.data))
+        self.assertIn('connection refused', logs.output[0])
+
+    @patch('core.health._migrations_applied', False)
+    @patch('core.health.MigrationExecutor.migration_plan')
+    def test_unapplied_migrations(self, patched_plan):
+        """Test readiness fails while migrations are pending"""
+        patched_plan.return_value = [('migration', False)]
+
+        with self.assertLogs('core.health', 'ERROR') as logs:
+            res = self.client.get(READY_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(res.data['checks']['migrations'], 'error')
+        self.assertIn('1 unapplied', logs.output[0])
+
+    def test_results_cached(self):
+        """Test repeated probes within the TTL reuse the result"""
+        check = Mock()
+        with patch.dict(readiness.checks, {'database': check}):
+            self.client.get(READY_URL)
+            self.client.get(READY_URL)
+
+        check.assert_called_once()
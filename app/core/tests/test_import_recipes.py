@@ -0,0 +1,171 @@
+"""
+Tests for the import_recipes command
+"""
+
+import io
+import json
+import os
+import tempfile
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from core.models import (
+    Recipe,
+    Tag,
+    Ingredient
+)
+
+
+def ndjson(*records):
+    """Return records as NDJSON text"""
+    return ''.join(json.dumps(record) + '\n' for record in records)
+
+
+def recipe_record(i, **params):
+    """Return an importable recipe record"""
+    record = {
+        'title': f'recipe {i}',
+        'time_minutes': 10,
+        'price': '4.50',
+        'tags': ['shared', f'tag {i}'],
+        'ingredients': [{'name': 'salt'}],
+    }
+    record.update(params)
+    return record
+
+
+class ImportRecipesTests(TestCase):
+    """Test importing recipes"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+
+    def run_import(self, data, *args, **options):
+        """Import data from stdin, return stdout"""
+        out = io.StringIO()
+        call_command(
+            'import_recipes', '-', *args,
+            stdin=io.StringIO(data),
+            stdout=out,
+            stderr=io.StringIO(),
+            **options,
+        )
+        return out.getvalue()
+
+    def test_import_ndjson(self):
+        """Test recipes, tags and ingredients are imported and linked"""
+        Tag.objects.create(user=self.user, name='shared')
+        data = ndjson(*[recipe_record(i) for i in range(5)])
+
+        out = self.run_import(data, '--user', self.user.email, batch_size=2)
+
+        self.assertIn('Imported 5 recipes', out)
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 5)
+        self.assertEqual(Tag.objects.filter(name='shared').count(), 1)
+        self.assertEqual(Ingredient.objects.count(), 1)
+        recipe = Recipe.objects.get(title='recipe 3')
+        self.assertEqual(recipe.price, Decimal('4.50'))
+        self.assertFalse(recipe.image)
+        self.assertEqual(
+            sorted(recipe.tags.values_list('name', flat=True)),
+            ['shared', 'tag 3'],
+        )
+        self.assertEqual(recipe.ingredients.get().name, 'salt')
+        # the trigger filled in the search vector
+        self.assertTrue(
+            Recipe.objects.filter(search_vector='salt').exists()
+        )
+
+    def test_import_without_copy(self):
+        """Test the INSERT path imports the same records"""
+        data = ndjson(recipe_record(1), recipe_record(2))
+
+        self.run_import(data, '--user', self.user.email, '--no-copy')
+
+        recipe = Recipe.objects.get(title='recipe 2')
+        self.assertEqual(recipe.tags.count(), 2)
+        self.assertFalse(recipe.image)
+
+    def test_import_csv_file(self):
+        """Test importing a CSV file with ; separated relations"""
+        with tempfile.NamedTemporaryFile(
+            'w', suffix='.csv', delete=False
+        ) as f:
+            f.write(
+                'title,time_minutes,price,tags,ingredients\n'
+                '"soup, hot",15,3.00,dinner;winter,water\n'
+            )
+        self.addCleanup(os.remove, f.name)
+
+        call_command(
+            'import_recipes', f.name, user=self.user.email,
+            stdout=io.StringIO(),
+        )
+
+        recipe = Recipe.objects.get()
+        self.assertEqual(recipe.title, 'soup, hot')
+        self.assertEqual(recipe.description, '')
+        self.assertEqual(
+            sorted(recipe.tags.values_list('name', flat=True)),
+            ['dinner', 'winter'],
+        )
+
+    def test_invalid_records_skipped(self):
+        """Test invalid records are reported and the rest imported"""
+        data = ndjson(
+            recipe_record(1),
+            recipe_record(2, time_minutes='soon'),
+            recipe_record(3, user='nobody@example.com'),
+        ) + 'not json\n'
+
+        out = self.run_import(data, '--user', self.user.email)
+
+        self.assertIn('Imported 1 recipes, skipped 3', out)
+        self.assertEqual(Recipe.objects.get().title, 'recipe 1')
+
+    def test_resume_from_offset(self):
+        """Test --offset skips records already imported"""
+        data = ndjson(*[recipe_record(i) for i in range(4)])
+
+        self.run_import(data, '--user', self.user.email, offset=3)
+
+        self.assertEqual(
+            list(Recipe.objects.values_list('title', flat=True)),
+            ['recipe 3'],
+        )
+
+    def test_records_choose_their_user(self):
+        """Test a record's user field overrides --user"""
+        other = get_user_model().objects.create_user(
+            email='other@example.com',
+            password='testpass123',
+        )
+        data = ndjson(recipe_record(1, user=other.email))
+
+        self.run_import(data)
+
+        recipe = Recipe.objects.get()
+        self.assertEqual(recipe.user, other)
+        self.assertEqual(recipe.tags.get(name='shared').user, other)
+
+    def test_unknown_default_user(self):
+        """Test an unknown --user fails before importing"""
+        with self.assertRaises(CommandError):
+            self.run_import(ndjson(recipe_record(1)), '--user', 'x@x.com')
+
+    def test_invalid_batch_size(self):
+        """Test a batch size below 1 fails instead of importing nothing"""
+        for batch_size in ('0', '-5'):
+            with self.assertRaises(CommandError):
+                self.run_import(
+                    ndjson(recipe_record(1)), '--batch-size', batch_size
+                )
+
+        self.assertFalse(Recipe.objects.exists())
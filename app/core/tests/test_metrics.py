@@ -0,0 +1,98 @@
+"""
+Tests for request metrics
+"""
+import os
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.metrics import Histogram, request_metrics
+
+
+METRICS_URL = reverse('metrics')
+
+
+class HistogramTests(TestCase):
+    """Test the histogram"""
+
+    def test_cumulative_buckets(self):
+        """Test samples are cumulative and end with +Inf"""
+        histogram = Histogram((1, 5))
+        for value in (0, 1, 3, 10):
+            histogram.observe(value)
+
+        self.assertEqual(
+            list(histogram.samples()), [(1, 2), (5, 3), ('+Inf', 4)]
+        )
+        self.assertEqual(histogram.sum, 14)
+        self.assertEqual(histogram.count, 4)
+
+
+@override_settings(METRICS_TOKEN='scrape-token')
+class RequestMetricsTests(TestCase):
+    """Test the metrics middleware and endpoint"""
+
+    def setUp(self):
+        request_metrics.clear()
+        self.client = APIClient()
+
+    def get_metrics(self):
+        return self.client.get(
+            METRICS_URL, HTTP_AUTHORIZATION='Bearer scrape-token'
+        )
+
+    def test_token_required(self):
+        """Test metrics are refused without the scraper's token"""
+        for headers in ({}, {'HTTP_AUTHORIZATION': 'Bearer wrong'}):
+            res = self.client.get(METRICS_URL, **headers)
+            self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_disabled_without_token(self):
+        """Test an unset token doesn't open the endpoint"""
+        res = self.client.get(METRICS_URL, HTTP_AUTHORIZATION='Bearer ')
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_metrics_per_url_name(self):
+        """Test requests are recorded under their url name"""
+        user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.client.force_authenticate(user)
+        self.client.get(reverse('recipe:recipe-list'))
+        self.client.get(reverse('recipe:recipe-list'))
+
+        res = self.get_metrics()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res['Content-Type'].startswith('text/plain'))
+        body = res.content.decode()
+        labels = (
+            f'pid="{os.getpid()}",endpoint="recipe:recipe-list",method="GET"'
+        )
+        self.assertIn('# TYPE http_request_duration_seconds histogram', body)
+        self.assertIn(f'http_request_duration_seconds_count{{{labels}}} 2',
+                      body)
+        self.assertIn(f'http_request_db_queries_count{{{labels}}} 2', body)
+        # the first, uncached list queries the database
+        self.assertNotIn(f'http_request_db_queries_sum{{{labels}}} 0\n', body)
+
+    def test_unmatched_urls_grouped(self):
+        """Test 404s for unknown paths share one label"""
+        self.client.get('/no/such/path/')
+        self.client.get('/another/missing/path/')
+
+        body = self.get_metrics().content.decode()
+
+        self.assertIn(
+            'http_request_duration_seconds_count'
+            f'{{pid="{os.getpid()}",endpoint="unmatched",method="GET"}} 2',
+            body,
+        )
+        self.assertNotIn('/no/such/path/', body)
@@ -0,0 +1,135 @@
+"""
+Tests for the read replica router
+"""
+
+from decimal import Decimal
+from unittest.mock import Mock, patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core import routers
+from core.models import Recipe
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+@override_settings(DATABASE_REPLICAS=['replica1', 'replica2'])
+@patch('core.routers.in_transaction', return_value=False)
+class ReplicaRouterTests(TestCase):
+    """Test the router's decisions"""
+
+    def setUp(self):
+        routers.reset_state()
+        self.addCleanup(routers.reset_state)
+        self.router = routers.ReplicaRouter()
+
+    def test_reads_use_primary_by_default(self, patched_in_transaction):
+        """Test reads outside opted in views go to the primary"""
+        self.assertEqual(self.router.db_for_read(Recipe), 'default')
+
+    def test_reads_use_replicas_when_enabled(self, patched_in_transaction):
+        """Test opted in reads go to one of the replicas"""
+        routers._state.use_replicas = True
+
+        self.assertIn(
+            self.router.db_for_read(Recipe), ['replica1', 'replica2']
+        )
+
+    @patch('core.routers.random.choice', side_effect=['replica1', 'replica2'])
+    def test_one_replica_per_request(
+        self, patched_choice, patched_in_transaction
+    ):
+        """Test every read of a request goes to the same replica"""
+        routers._state.use_replicas = True
+
+        self.assertEqual(self.router.db_for_read(Recipe), 'replica1')
+        self.assertEqual(self.router.db_for_read(Recipe), 'replica1')
+
+        routers.reset_state()
+        routers._state.use_replicas = True
+        self.assertEqual(self.router.db_for_read(Recipe), 'replica2')
+
+    def test_write_pins_reads_to_primary(self, patched_in_transaction):
+        """Test reads after a write in the same request use the primary"""
+        routers._state.use_replicas = True
+
+        self.assertEqual(self.router.db_for_write(Recipe), 'default')
+        self.assertEqual(self.router.db_for_read(Recipe), 'default')
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replicas_configured(self, patched_in_transaction):
+        """Test everything uses the primary without replicas"""
+        routers._state.use_replicas = True
+
+        self.assertEqual(self.router.db_for_read(Recipe), 'default')
+
+    def test_migrations_only_on_primary(self, patched_in_transaction):
+        """Test replicas are never migrated"""
+        self.assertTrue(self.router.allow_migrate('default', 'core'))
+        self.assertFalse(self.router.allow_migrate('replica1', 'core'))
+
+    def test_transactions_read_primary(self, patched_in_transaction):
+        """Test reads inside a transaction see its uncommitted writes"""
+        patched_in_transaction.return_value = True
+        routers._state.use_replicas = True
+
+        self.assertEqual(self.router.db_for_read(Recipe), 'default')
+
+
+# the only alias in tests, so the queries still run; the patched choice
+# records when a replica was picked
+@override_settings(DATABASE_REPLICAS=['default'])
+@patch('core.routers.in_transaction', Mock(return_value=False))
+@patch('core.routers.random.choice', return_value='default')
+class ReplicaReadViewTests(TestCase):
+    """Test which requests read from replicas"""
+
+    def setUp(self):
+        routers.reset_state()
+        self.addCleanup(routers.reset_state)
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_safe_requests_use_replicas(self, patched_choice):
+        """Test listing recipes reads from a replica"""
+        self.client.get(RECIPES_URL)
+
+        patched_choice.assert_called()
+
+    def test_writes_use_primary(self, patched_choice):
+        """Test creating a recipe never reads from a replica"""
+        payload = {
+            'title': 'sample',
+            'time_minutes': 5,
+            'price': Decimal('1.00'),
+        }
+        self.client.post(RECIPES_URL, payload, format='json')
+
+        patched_choice.assert_not_called()
+
+    def test_reads_after_write_use_primary(self, patched_choice):
+        """Test a user's reads stay on the primary right after a write"""
+        self.client.post(
+            RECIPES_URL,
+            {'title': 'sample', 'time_minutes': 5, 'price': '1.00'},
+            format='json',
+        )
+        self.client.get(RECIPES_URL)
+        patched_choice.assert_not_called()
+
+        other = get_user_model().objects.create_user(
+            email='other@example.com',
+            password='testpass123',
+        )
+        self.client.force_authenticate(other)
+        self.client.get(RECIPES_URL)
+        patched_choice.assert_called()
@@ -0,0 +1,58 @@
+"""
+Tests for the seed_benchmark_data command
+"""
+
+import io
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+
+from core.models import (
+    Recipe,
+    Tag,
+    Ingredient
+)
+
+
+class SeedBenchmarkDataTests(TestCase):
+    """Test seeding benchmark data"""
+
+    def seed(self, **options):
+        call_command('seed_benchmark_data', stdout=io.StringIO(), **options)
+
+    def test_seed_counts(self):
+        """Test the requested numbers of rows are created"""
+        self.seed(users=3, recipes=50, tags=5, ingredients=8)
+
+        self.assertEqual(get_user_model().objects.count(), 3)
+        self.assertEqual(Recipe.objects.count(), 50)
+        self.assertEqual(Tag.objects.count(), 3 * 5)
+        self.assertEqual(Ingredient.objects.count(), 3 * 8)
+        # links only point at the recipe owner's tags and ingredients
+        for recipe in Recipe.objects.prefetch_related('tags', 'ingredients'):
+            self.assertTrue(recipe.ingredients.all())
+            for obj in [*recipe.tags.all(), *recipe.ingredients.all()]:
+                self.assertEqual(obj.user_id, recipe.user_id)
+
+    def test_seed_users_can_log_in(self):
+        """Test seeded users get the given password"""
+        self.seed(users=1, recipes=1, password='secret123')
+
+        user = get_user_model().objects.get(email='bench0@example.com')
+        self.assertTrue(user.check_password('secret123'))
+
+    def test_seed_is_deterministic(self):
+        """Test the same seed produces the same data"""
+        self.seed(users=2, recipes=20, seed=7)
+        first = list(Recipe.objects.order_by('id').values_list(
+            'title', 'price', 'time_minutes'
+        ))
+        Recipe.objects.all().delete()
+        get_user_model().objects.all().delete()
+        self.seed(users=2, recipes=20, seed=7)
+        second = list(Recipe.objects.order_by('id').values_list(
+            'title', 'price', 'time_minutes'
+        ))
+
+        self.assertEqual(first, second)
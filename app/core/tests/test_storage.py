@@ -0,0 +1,71 @@
+"""
+Tests for the content addressed storage
+"""
+
+import hashlib
+
+from django.core.files.base import ContentFile
+from django.test import SimpleTestCase
+
+from core.storage import ContentAddressedStorage, OverwritingStorage
+from core.tests.utils import TempMediaRootMixin
+
+
+class ContentAddressedStorageTests(TempMediaRootMixin, SimpleTestCase):
+    """Test storing files by content hash"""
+
+    def setUp(self):
+        super().setUp()
+        self.storage = ContentAddressedStorage()
+
+    def test_named_by_content_hash(self):
+        """Test files are named after the sha256 of their content"""
+        digest = hashlib.sha256(b'image bytes').hexdigest()
+
+        name = self.storage.save(
+            'uploads/recipe/random-name.JPG', ContentFile(b'image bytes')
+        )
+
+        self.assertEqual(name, f'uploads/recipe/{digest[:2]}/{digest}.jpg')
+        with self.storage.open(name) as f:
+            self.assertEqual(f.read(), b'image bytes')
+
+    def test_identical_content_shared(self):
+        """Test saving the same bytes twice returns the same file"""
+        name1 = self.storage.save('uploads/recipe/a.jpg', ContentFile(b'same'))
+        name2 = self.storage.save('uploads/recipe/b.jpg', ContentFile(b'same'))
+        name3 = self.storage.save('uploads/recipe/c.jpg', ContentFile(b'diff'))
+
+        self.assertEqual(name1, name2)
+        self.assertNotEqual(name1, name3)
+        _, files = self.storage.listdir(f'uploads/recipe/{name1[15:17]}')
+        self.assertEqual(files.count(name1.rsplit('/', 1)[1]), 1)
+
+    def test_no_temporary_files_left(self):
+        """Test the temporary upload file is removed"""
+        self.storage.save('uploads/recipe/a.jpg', ContentFile(b'one'))
+        self.storage.save('uploads/recipe/b.jpg', ContentFile(b'one'))
+
+        _, files = self.storage.listdir('uploads/recipe')
+
+        self.assertEqual(files, [])
+
+
+class OverwritingStorageTests(TempMediaRootMixin, SimpleTestCase):
+    """Test storing files under a fixed name"""
+
+    def setUp(self):
+        super().setUp()
+        self.storage = OverwritingStorage()
+
+    def test_existing_file_replaced(self):
+        """Test saving to a taken name replaces the file in place"""
+        name1 = self.storage.save('renditions/a-small.jpg', ContentFile(b'1'))
+        name2 = self.storage.save('renditions/a-small.jpg', ContentFile(b'2'))
+
+        self.assertEqual(name1, 'renditions/a-small.jpg')
+        self.assertEqual(name2, name1)
+        _, files = self.storage.listdir('renditions')
+        self.assertEqual(files, ['a-small.jpg'])
+        with self.storage.open(name1) as f:
+            self.assertEqual(f.read(), b'2')
@@ -0,0 +1,26 @@
+"""
+Helpers shared by the test modules
+"""
+import shutil
+import tempfile
+
+
+class TempMediaRootMixin:
+    """Run each test against an empty MEDIA_ROOT, deleted afterwards
+
+    Test cases overriding setUp call super().setUp() before using storage.
+    """
+
+    def media_settings(self, media_root):
+        """Return the settings pointed at the test's media root"""
+        return {'MEDIA_ROOT': media_root}
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = self.settings(
+            **self.media_settings(self.media_root)
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
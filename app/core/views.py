@@ -2,10 +2,53 @@
 Core views for app.
 """
 
+import hmac
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.views.decorators.http import require_GET
+
+from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 
+from core.health import readiness
+from core.metrics import request_metrics
+
 @api_view(['GET'])
 def health_check(request):
     """Returns successful response"""
-    return Response({'healthy':True})
\ No newline at end of file
+    return Response({'healthy':True})
+
+
+@api_view(['GET'])
+def liveness(request):
+    """Returns successful response while the process can serve requests"""
+    # deliberately touches nothing, a broken dependency should take the
+    # worker out of rotation (readiness), not get it restarted
+    return Response({'alive': True})
+
+
+@api_view(['GET'])
+def readiness_check(request):
+    """Returns 503 unless the database, media volume and schema are usable"""
+    ready, checks = readiness.get()
+    return Response(
+        {'ready': ready, 'checks': checks},
+        status=status.HTTP_200_OK if ready
+        else status.HTTP_503_SERVICE_UNAVAILABLE,
+    )
+
+
+@require_GET
+def metrics(request):
+    """Returns request metrics in the Prometheus text format"""
+    # nginx forwards /api/ from anywhere, only the scraper has the token
+    expected = f'Bearer {settings.METRICS_TOKEN}'.encode()
+    given = request.META.get('HTTP_AUTHORIZATION', '').encode()
+    if not settings.METRICS_TOKEN or not hmac.compare_digest(given, expected):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        request_metrics.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
@@ -0,0 +1,92 @@
+"""
+Response caching for the recipe apis
+"""
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.http import parse_http_date_safe
+
+from rest_framework.response import Response
+
+from recipe.conditional import not_modified_response, set_validators
+
+
+def get_cache():
+    """Return the cache used for recipe responses"""
+    return caches[settings.RECIPE_CACHE_ALIAS]
+
+
+def _version_key(user_id):
+    return f'recipe:version:{user_id}'
+
+
+def get_user_version(user_id):
+    """Return the current cache version for a user"""
+    cache = get_cache()
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        # add() so concurrent requests agree on a single version
+        cache.add(_version_key(user_id), uuid.uuid4().hex, timeout=None)
+        version = cache.get(_version_key(user_id))
+
+    return version
+
+
+def bump_user_version(user_id):
+    """Invalidate every cached response for a user"""
+    # a fresh random version instead of incr() so no bump can be lost on
+    # backends where incr is not atomic across processes
+    get_cache().set(_version_key(user_id), uuid.uuid4().hex, timeout=None)
+
+
+def invalidate_user(user_id):
+    """Invalidate a user's responses now and again once the write commits"""
+    # the second bump stops a read that ran before the commit from caching
+    # stale rows under the new version
+    bump_user_version(user_id)
+    transaction.on_commit(lambda: bump_user_version(user_id))
+
+
+def response_cache_key(request):
+    """Return the cache key for a request, keyed by user and query"""
+    user_id = request.user.id
+    url = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    return f'recipe:response:{user_id}:{get_user_version(user_id)}:{url}'
+
+
+class CachedResponseMixin:
+    """Cache successful list and retrieve responses per user"""
+    # place before the conditional mixins so cached responses keep their
+    # validators and can answer 304 without touching the database
+
+    def list(self, request, *args, **kwargs):
+        return self._cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+    def _cached_response(self, view_func, request, *args, **kwargs):
+        """Return the cached response data or render and cache it"""
+        cache = get_cache()
+        key = response_cache_key(request)
+        cached = cache.get(key)
+        if cached is not None:
+            data, etag, last_modified = cached
+            response = not_modified_response(request, etag, last_modified)
+            if response is not None:
+                return response
+            return set_validators(Response(data), etag, last_modified)
+
+        response = view_func(request, *args, **kwargs)
+        if response.status_code == 200 and response.has_header('ETag'):
+            last_modified = parse_http_date_safe(
+                response.get('Last-Modified', '')
+            )
+            cache.set(key, (response.data, response['ETag'], last_modified))
+
+        return response
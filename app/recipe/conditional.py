@@ -0,0 +1,98 @@
+"""
+Conditional GET support for the recipe apis
+"""
+import calendar
+import hashlib
+
+from django.core.exceptions import ValidationError
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+
+
+def make_etag(*parts):
+    """Return a quoted etag for the given values"""
+    return quote_etag(hashlib.md5(repr(parts).encode()).hexdigest())
+
+
+def not_modified_response(request, etag, last_modified=None):
+    """Return a 304 response if the request validators match, else None"""
+    response = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=last_modified,
+    )
+    if response is not None:
+        response['ETag'] = etag
+
+    return response
+
+
+def set_validators(response, etag, last_modified=None):
+    """Add ETag and Last-Modified headers to a successful response"""
+    if response.status_code == 200:
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+
+    return response
+
+
+class ConditionalListMixin:
+    """Answer If-None-Match on list requests before serializing"""
+    # attributes of each row that change the rendered page
+    etag_fields = ('id', 'updated_at')
+
+    def list(self, request, *args, **kwargs):
+        etag = self.get_list_etag(request)
+        response = not_modified_response(request, etag)
+        if response is not None:
+            return response
+
+        response = super().list(request, *args, **kwargs)
+        return set_validators(response, etag)
+
+    def get_list_etag(self, request):
+        """Return an etag from the ids and update times on the page"""
+        # same page query as the list, but only two columns and no
+        # prefetching, so a 304 never loads or serializes the rows
+        queryset = self.filter_queryset(self.get_queryset())
+        queryset = queryset.prefetch_related(None).only('id', 'updated_at')
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        rows = [
+            tuple(getattr(obj, field) for field in self.etag_fields)
+            for obj in page
+        ]
+
+        return make_etag(
+            request.get_full_path(),
+            rows,
+            paginator.has_next,
+            paginator.has_previous,
+        )
+
+
+class ConditionalRetrieveMixin:
+    """Answer If-None-Match / If-Modified-Since on detail requests"""
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.filter_queryset(self.get_queryset())
+        try:
+            updated_at = queryset.prefetch_related(None).filter(
+                **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+            ).values_list('updated_at', flat=True).first()
+        except (TypeError, ValueError, ValidationError):
+            updated_at = None
+        if updated_at is None:
+            # let the regular path return the 404
+            return super().retrieve(request, *args, **kwargs)
+
+        etag = make_etag(request.get_full_path(), updated_at)
+        last_modified = calendar.timegm(updated_at.utctimetuple())
+        response = not_modified_response(request, etag, last_modified)
+        if response is not None:
+            return response
+
+        response = super().retrieve(request, *args, **kwargs)
+        return set_validators(response, etag, last_modified)
@@ -0,0 +1,69 @@
+"""
+Streaming export of recipe collections
+"""
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from rest_framework.renderers import BaseRenderer
+
+CSV_FIELDS = [
+    'id', 'title', 'time_minutes', 'price', 'link', 'description', 'image',
+    'tags', 'ingredients',
+]
+
+
+class NDJSONRenderer(BaseRenderer):
+    """One JSON document per line"""
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # exports stream their own body, this only renders errors
+        return json.dumps(data, cls=DjangoJSONEncoder) + '\n'
+
+
+class CSVRenderer(NDJSONRenderer):
+    """Comma separated values with a header row"""
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class _Echo:
+    """File-like object handing back what csv.writer writes"""
+
+    def write(self, value):
+        return value
+
+
+def ndjson_lines(chunks):
+    """Yield one line per serialized recipe"""
+    encoder = DjangoJSONEncoder()
+    for chunk in chunks:
+        # one string per chunk keeps the number of writes to the socket low
+        yield ''.join(encoder.encode(item) + '\n' for item in chunk)
+
+
+def csv_lines(chunks):
+    """Yield a header row and one row per serialized recipe"""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_FIELDS)
+    for chunk in chunks:
+        rows = []
+        for item in chunk:
+            row = dict(item)
+            # relations flattened to ; separated names
+            for field in ('tags', 'ingredients'):
+                row[field] = ';'.join(obj['name'] for obj in row[field])
+            rows.append(writer.writerow(
+                [row.get(field, '') for field in CSV_FIELDS]
+            ))
+        yield ''.join(rows)
+
+
+EXPORT_FORMATS = {
+    NDJSONRenderer.format: ndjson_lines,
+    CSVRenderer.format: csv_lines,
+}
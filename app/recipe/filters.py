@@ -0,0 +1,56 @@
+"""
+Filter backends for the recipe apis
+"""
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast
+
+from rest_framework.filters import BaseFilterBackend
+
+
+class RecipeSearchFilter(BaseFilterBackend):
+    """Full text search over recipes, ranked by relevance"""
+    search_param = 'search'
+    search_config = 'english'
+
+    def get_search_query(self, request):
+        """Return the SearchQuery for the request, if any"""
+        terms = request.query_params.get(self.search_param, '').strip()
+        if not terms:
+            return None
+
+        return SearchQuery(
+            terms,
+            config=self.search_config,
+            search_type='websearch',
+        )
+
+    def filter_queryset(self, request, queryset, view):
+        query = self.get_search_query(request)
+        if query is None:
+            return queryset
+
+        # cast to double so the rank round trips exactly through the cursor
+        return queryset.filter(search_vector=query).annotate(
+            rank=Cast(SearchRank(F('search_vector'), query), FloatField()),
+        )
+
+    def get_ordering(self, request, queryset, view):
+        """Order by rank when searching, used by cursor pagination"""
+        if self.get_search_query(request) is None:
+            return view.pagination_class.ordering
+
+        return ('-rank', '-id')
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.search_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Search recipe titles, descriptions, tags '
+                               'and ingredients',
+                'schema': {'type': 'string'},
+            },
+        ]
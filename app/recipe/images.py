@@ -0,0 +1,202 @@
+"""
+Background image processing for recipe images
+"""
+import io
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils import timezone
+
+from PIL import Image, ImageOps
+
+from core.models import Recipe
+from core.routers import pin_to_primary
+from core.storage import overwriting_storage
+from recipe.cache import invalidate_user
+
+logger = logging.getLogger(__name__)
+
+# rendition name -> longest edge in pixels
+RENDITIONS = {
+    'thumbnail': 150,
+    'medium': 600,
+    'large': 1200,
+}
+# file extension -> Pillow format and encoder options
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+
+_executor = None
+
+
+def get_executor():
+    """Return the worker pool, created on first use in each process"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_PROCESSING_WORKERS,
+            thread_name_prefix='recipe-image',
+        )
+    return _executor
+
+
+def schedule_image_processing(recipe_id):
+    """Process a recipe's image once the current transaction commits"""
+    if settings.IMAGE_PROCESSING_WORKERS > 0:
+        transaction.on_commit(
+            lambda: get_executor().submit(_process_in_worker, recipe_id)
+        )
+    else:
+        transaction.on_commit(lambda: process_recipe_image(recipe_id))
+
+
+def _process_in_worker(recipe_id):
+    """Run process_recipe_image on a pool thread"""
+    try:
+        process_recipe_image(recipe_id)
+    finally:
+        # pool threads get their own connection, don't leak it
+        connection.close()
+
+
+def rendition_name(image_name, rendition, ext):
+    """Return the storage name of a rendition of image_name"""
+    stem = os.path.splitext(os.path.basename(image_name))[0]
+    return os.path.join(
+        'uploads', 'recipe', 'renditions', f'{stem}-{rendition}.{ext}'
+    )
+
+
+def rendition_names(image_name):
+    """Return the storage names of every rendition of image_name"""
+    return [
+        rendition_name(image_name, rendition, ext)
+        for rendition in RENDITIONS
+        for ext in FORMATS
+    ]
+
+
+def image_storage():
+    """Return the storage holding uploaded recipe images"""
+    return Recipe._meta.get_field('image').storage
+
+
+def release_image(image_name):
+    """Delete an image and its renditions once no recipe uses it"""
+    if not image_name or Recipe.objects.filter(image=image_name).exists():
+        return
+    storage = image_storage()
+    try:
+        modified = os.path.getmtime(storage.path(image_name))
+    except FileNotFoundError:
+        return
+    # an upload of the same content may have just reused the file and not
+    # committed yet, gc_recipe_images picks these up later
+    if time.time() - modified < settings.IMAGE_GC_GRACE_SECONDS:
+        return
+    storage.delete(image_name)
+    for name in rendition_names(image_name):
+        default_storage.delete(name)
+
+
+def decode_upright(img, size):
+    """Decode img for resizing to at most size pixels, rotated and RGB(A)"""
+    # let the jpeg decoder downscale while decoding
+    img.draft('RGB', (size, size))
+    # apply the camera rotation, the exif block itself is not copied
+    img = ImageOps.exif_transpose(img)
+    if img.mode not in ('RGB', 'RGBA'):
+        # greyscale and palette images can carry alpha too (LA, PA)
+        has_alpha = 'A' in img.getbands() or 'transparency' in img.info
+        img = img.convert('RGBA' if has_alpha else 'RGB')
+    return img
+
+
+def encode(img, ext):
+    """Return img encoded in the format of ext"""
+    fmt, options = FORMATS[ext]
+    out = img.convert('RGB') if fmt == 'JPEG' else img
+    buffer = io.BytesIO()
+    out.save(buffer, fmt, **options)
+    return buffer.getvalue()
+
+
+def encode_width(image_file, width, ext):
+    """Return an image resized to width, never upscaled, encoded as ext"""
+    with Image.open(image_file) as img:
+        img = decode_upright(img, width)
+        if img.width > width:
+            height = max(1, round(img.height * width / img.width))
+            img = img.resize((width, height), Image.LANCZOS)
+        return encode(img, ext)
+
+
+def encode_renditions(image_file, image_name):
+    """Write the renditions of an image and return their storage names"""
+    with Image.open(image_file) as img:
+        img = decode_upright(img, max(RENDITIONS.values()))
+
+        renditions = {}
+        for rendition, size in RENDITIONS.items():
+            resized = img.copy()
+            resized.thumbnail((size, size), Image.LANCZOS)
+            files = {}
+            for ext in FORMATS:
+                # reprocessing the same image, even concurrently, rewrites
+                # the same files
+                files[ext] = overwriting_storage.save(
+                    rendition_name(image_name, rendition, ext),
+                    ContentFile(encode(resized, ext)),
+                )
+            renditions[rendition] = {
+                'width': resized.width,
+                'height': resized.height,
+                **files,
+            }
+
+    return renditions
+
+
+def process_recipe_image(recipe_id):
+    """Decode, strip, resize and re-encode a recipe's uploaded image"""
+    recipe = Recipe.objects.filter(pk=recipe_id).first()
+    if recipe is None or not recipe.image:
+        return
+
+    image_name = recipe.image.name
+    # identical uploads share a file, and so its renditions
+    shared = Recipe.objects.filter(
+        image=image_name,
+        image_status=Recipe.ImageStatus.READY,
+    ).exclude(pk=recipe_id).values_list('image_renditions', flat=True).first()
+    try:
+        if shared:
+            renditions = shared
+        else:
+            with recipe.image.open('rb') as image_file:
+                renditions = encode_renditions(image_file, image_name)
+        status = Recipe.ImageStatus.READY
+    except Exception:
+        logger.exception('Processing image of recipe %s failed', recipe_id)
+        renditions = {}
+        status = Recipe.ImageStatus.FAILED
+
+    # only record the result if no newer upload replaced the image meanwhile
+    updated = Recipe.objects.filter(pk=recipe_id, image=image_name).update(
+        image_status=status,
+        image_renditions=renditions,
+        updated_at=timezone.now(),
+    )
+    if updated:
+        # the user's next poll must not read, and cache, the old row from a
+        # lagging replica
+        pin_to_primary(recipe.user_id)
+        invalidate_user(recipe.user_id)
@@ -0,0 +1,150 @@
+"""
+Authorized access to uploaded recipe images
+"""
+import mimetypes
+import os
+import posixpath
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils.cache import patch_cache_control
+
+from rest_framework.exceptions import Throttled, ValidationError
+
+from core.models import Recipe
+from recipe.images import FORMATS, encode_width, image_storage
+from recipe.resize import rendition_cache
+from recipe.throttles import ResizeThrottle
+
+IMAGE_DIR = 'uploads/recipe/'
+RENDITION_DIR = 'uploads/recipe/renditions/'
+
+CONTENT_TYPES = {
+    'webp': 'image/webp',
+    'jpg': 'image/jpeg',
+}
+
+
+def owned_recipes(user, name):
+    """Return the recipes of user whose image or renditions include name"""
+    recipes = Recipe.objects.filter(user=user)
+    if name.startswith(RENDITION_DIR):
+        # renditions are named <image stem>-<rendition>.<ext>
+        stem = os.path.splitext(posixpath.basename(name))[0].rsplit('-', 1)[0]
+        return recipes.filter(image__contains=f'/{stem}.')
+    return recipes.filter(image=name)
+
+
+def file_response(root, name, redirect_url, content_type):
+    """Return a response handing root/name over to nginx"""
+    if redirect_url:
+        # nginx streams the file with sendfile, the app never reads it
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = redirect_url + quote(name)
+        return response
+    # no proxy in development
+    try:
+        return FileResponse(
+            open(os.path.join(root, name), 'rb'),
+            content_type=content_type,
+        )
+    except FileNotFoundError:
+        raise Http404
+
+
+def media_response(name):
+    """Return a response sending an uploaded file"""
+    content_type, _ = mimetypes.guess_type(name)
+    response = file_response(
+        image_storage().location,
+        name,
+        settings.MEDIA_ACCEL_REDIRECT_URL,
+        content_type,
+    )
+    # stored names never change content, but access can be revoked
+    patch_cache_control(
+        response, private=True, max_age=settings.MEDIA_CACHE_SECONDS
+    )
+    return response
+
+
+def authorize(user, name):
+    """Raise Http404 unless user owns a recipe using the image at name"""
+    # the same 404 for missing and forbidden files, names don't leak
+    if (
+        posixpath.normpath(name) != name
+        or not name.startswith(IMAGE_DIR)
+        or not owned_recipes(user, name).exists()
+    ):
+        raise Http404
+
+
+def serve_media(user, name):
+    """Return the file at name if user owns a recipe using it, else 404"""
+    authorize(user, name)
+    return media_response(name)
+
+
+def resize_params(query_params):
+    """Return the allowed width and format asked for
+
+    Widths are rounded up to the next of IMAGE_RESIZE_WIDTHS, so an image
+    has a handful of cached renditions however clients pick widths.
+    """
+    errors = {}
+    widths = sorted(settings.IMAGE_RESIZE_WIDTHS)
+    try:
+        width = int(query_params.get('width', ''))
+    except ValueError:
+        width = 0
+    if width < 1:
+        errors['width'] = ['Must be a positive integer.']
+    else:
+        width = next(
+            (allowed for allowed in widths if allowed >= width), widths[-1]
+        )
+    ext = query_params.get('format', 'webp')
+    if ext not in FORMATS:
+        errors['format'] = [f'Must be one of {", ".join(FORMATS)}.']
+    if errors:
+        raise ValidationError(errors)
+    return width, ext
+
+
+def serve_resized(request, name, width, ext):
+    """Return the image at name resized to width, encoded once and cached"""
+    authorize(request.user, name)
+    if name.startswith(RENDITION_DIR):
+        raise Http404
+    stem = os.path.splitext(posixpath.basename(name))[0]
+    key = f'{stem}-{width}.{ext}'
+
+    def create():
+        # only cache misses cost a decode and encode, hits are free
+        throttle = ResizeThrottle()
+        if not throttle.allow_request(request, None):
+            raise Throttled(throttle.wait())
+        try:
+            with image_storage().open(name, 'rb') as image_file:
+                return encode_width(image_file, width, ext)
+        except OSError:
+            # missing or not decodable originals
+            raise Http404
+
+    cache = rendition_cache()
+    path = cache.get_or_create(key, create)
+    response = file_response(
+        cache.directory,
+        os.path.relpath(path, cache.directory),
+        settings.IMAGE_RESIZE_ACCEL_REDIRECT_URL,
+        CONTENT_TYPES[ext],
+    )
+    # image names are content addressed, a new upload gets a new url
+    patch_cache_control(
+        response,
+        private=True,
+        max_age=settings.IMAGE_RESIZE_CACHE_SECONDS,
+        immutable=True,
+    )
+    return response
@@ -0,0 +1,17 @@
+"""
+Pagination for the recipe apis
+"""
+
+from django.conf import settings
+
+from rest_framework.pagination import CursorPagination
+
+
+class IdCursorPagination(CursorPagination):
+    """Keyset pagination on id with opaque cursors"""
+    # id is unique and never changes, so each page is a single index range
+    # scan (WHERE id < cursor) no matter how deep the client has scrolled
+    ordering = '-id'
+    page_size = settings.API_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.API_MAX_PAGE_SIZE
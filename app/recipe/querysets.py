@@ -0,0 +1,108 @@
+"""
+Queryset helpers for the recipe apis
+"""
+
+from django.db.models import (
+    Count,
+    Exists,
+    IntegerField,
+    OuterRef,
+    Subquery,
+    prefetch_related_objects,
+)
+from django.db.models.functions import Coalesce
+
+from rest_framework.relations import ManyRelatedField
+from rest_framework.serializers import ListSerializer
+
+
+def get_prefetch_fields(serializer):
+    """Return the many-to-many sources a serializer renders."""
+    return [
+        field.source for field in serializer.fields.values()
+        if not field.write_only
+        and isinstance(field, (ListSerializer, ManyRelatedField))
+    ]
+
+
+def prefetch_for_serializer(queryset, serializer):
+    """Prefetch the relations the serializer needs to avoid N+1 queries."""
+    prefetch_fields = get_prefetch_fields(serializer)
+    if prefetch_fields:
+        queryset = queryset.prefetch_related(*prefetch_fields)
+
+    return queryset
+
+
+def only_for_serializer(queryset, serializer):
+    """Load only the columns the serializer renders."""
+    columns = {field.name for field in queryset.model._meta.concrete_fields}
+    sources = [
+        field.source for field in serializer.fields.values()
+        if not field.write_only and field.source in columns
+    ]
+    # the primary key is always loaded
+    return queryset.only(*sources)
+
+
+def iterate_in_chunks(queryset, chunk_size, prefetch_fields=()):
+    """Yield lists of rows read through a server-side cursor."""
+    # iterator() skips prefetch_related, so prefetch each chunk instead:
+    # memory holds one chunk of rows and relations at a time
+    chunk = []
+    for obj in queryset.prefetch_related(None).iterator(chunk_size=chunk_size):
+        chunk.append(obj)
+        if len(chunk) >= chunk_size:
+            prefetch_related_objects(chunk, *prefetch_fields)
+            yield chunk
+            chunk = []
+    if chunk:
+        prefetch_related_objects(chunk, *prefetch_fields)
+        yield chunk
+
+
+def filter_by_related(queryset, field_name, ids, match_all=False):
+    """Filter to rows linked to any (or all) of ids through field_name."""
+    field = queryset.model._meta.get_field(field_name)
+    through = field.remote_field.through
+    links = through.objects.filter(
+        **{field.m2m_field_name(): OuterRef('pk')}
+    )
+    related_fk = f'{field.m2m_reverse_field_name()}_id'
+    # correlated EXISTS probes on the (recipe, related) unique index instead
+    # of joining the m2m table, so no DISTINCT is needed afterwards
+    if match_all:
+        for related_id in set(ids):
+            queryset = queryset.filter(
+                Exists(links.filter(**{related_fk: related_id}))
+            )
+        return queryset
+
+    return queryset.filter(Exists(links.filter(**{f'{related_fk}__in': ids})))
+
+
+def annotate_link_count(queryset, field, name):
+    """Annotate each related row with how many rows link to it via field."""
+    through = field.remote_field.through
+    related_field = field.m2m_reverse_field_name()
+    # one probe of the through table's index on the related id per row on
+    # the page, instead of joining and grouping every link of the user
+    counts = (
+        through.objects.filter(**{related_field: OuterRef('pk')})
+        .order_by()
+        .values(related_field)
+        .annotate(count=Count('*'))
+        .values('count')
+    )
+    return queryset.annotate(**{
+        name: Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+    })
+
+
+def filter_linked(queryset, field):
+    """Filter related rows to those linked to at least one row via field."""
+    through = field.remote_field.through
+    links = through.objects.filter(
+        **{field.m2m_reverse_field_name(): OuterRef('pk')}
+    )
+    return queryset.filter(Exists(links))
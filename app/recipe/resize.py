@@ -0,0 +1,157 @@
+"""
+Disk cache of recipe images resized on request
+"""
+import fcntl
+import functools
+import hashlib
+import os
+import tempfile
+import threading
+
+from django.conf import settings
+
+# stripes of lock files, so concurrent misses for one key wait for each
+# other without a lock file per key to clean up
+LOCK_STRIPES = 256
+# evicting goes below the limit, so the next writes don't scan again
+LOW_WATER_MARK = 0.9
+
+
+class RenditionCache:
+    """Size bounded directory of encoded images, least recently used go first
+
+    Hits bump the file's mtime, eviction deletes the oldest mtimes. Misses
+    for the same key are serialized with file locks shared by every worker
+    process, so a burst of requests for a new rendition encodes it once.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # approximate size, rescanned whenever it passes max_bytes. Other
+        # processes' writes are only seen by the scan
+        self._size = None
+        self._size_lock = threading.Lock()
+
+    def path(self, key):
+        """Return the file of key"""
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key):
+        """Return the file of key and mark it used, or None"""
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def get_or_create(self, key, create):
+        """Return the file of key, storing the bytes of create() on a miss"""
+        path = self.get(key)
+        if path is not None:
+            return path
+
+        with self._key_lock(key):
+            # another request may have encoded it while this one waited
+            path = self.get(key)
+            if path is not None:
+                return path
+            data = create()
+            path = self.path(key)
+            self._write(path, data)
+
+        self._added(len(data))
+        return path
+
+    def _key_lock(self, key):
+        lock_dir = os.path.join(self.directory, 'locks')
+        os.makedirs(lock_dir, exist_ok=True)
+        stripe = hashlib.sha1(key.encode()).digest()[0] % LOCK_STRIPES
+        return FileLock(os.path.join(lock_dir, f'{stripe}.lock'))
+
+    def _write(self, path, data):
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                tmp.write(data)
+            os.chmod(tmp_path, 0o644)
+            # readers never see a partial file
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _added(self, size):
+        with self._size_lock:
+            if self._size is not None:
+                self._size += size
+            if self._size is None or self._size > self.max_bytes:
+                self._size = self.evict()
+
+    def evict(self):
+        """Delete least recently used files until under the limit
+
+        Returns the size of the cache afterwards.
+        """
+        files = []
+        for directory, dirnames, filenames in os.walk(self.directory):
+            if directory == self.directory and 'locks' in dirnames:
+                dirnames.remove('locks')
+            for filename in filenames:
+                if filename.endswith('.tmp'):
+                    continue
+                path = os.path.join(directory, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+
+        size = sum(file_size for _, file_size, _ in files)
+        if size <= self.max_bytes:
+            return size
+        target = self.max_bytes * LOW_WATER_MARK
+        for _, file_size, path in sorted(files):
+            if size <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= file_size
+
+        return size
+
+
+class FileLock:
+    """Exclusive flock held for a with block, across threads and processes"""
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    def __enter__(self):
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+        self._fd = None
+
+
+@functools.lru_cache(maxsize=None)
+def _cache(directory, max_bytes):
+    return RenditionCache(directory, max_bytes)
+
+
+def rendition_cache():
+    """Return the cache configured in settings, one per process"""
+    return _cache(
+        settings.IMAGE_RESIZE_CACHE_DIR,
+        settings.IMAGE_RESIZE_CACHE_MAX_BYTES,
+    )
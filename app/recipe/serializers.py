@@ -2,12 +2,21 @@
 Serializers for recipe api
 """
 
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import models, transaction
+from django.db.models import prefetch_related_objects
+from django.utils import timezone
+
 from rest_framework import serializers
+from drf_spectacular.utils import extend_schema_field
 from core.models import (
     Recipe, 
     Tag,
     Ingredient
 )
+from recipe.cache import invalidate_user
+from recipe.images import FORMATS
 
 class TagSerializer(serializers.ModelSerializer):
     """Serializer for tags."""
@@ -25,6 +34,109 @@ class IngredientSerializer(serializers.ModelSerializer):
         fields = ['id','name']
         read_only_fields = ['id']
 
+
+class TagCountSerializer(TagSerializer):
+    """Serializer for tags with the number of recipes using them"""
+    recipe_count = serializers.IntegerField(read_only=True)
+
+    class Meta(TagSerializer.Meta):
+        fields = TagSerializer.Meta.fields + ['recipe_count']
+
+
+class IngredientCountSerializer(IngredientSerializer):
+    """Serializer for ingredients with the number of recipes using them"""
+    recipe_count = serializers.IntegerField(read_only=True)
+
+    class Meta(IngredientSerializer.Meta):
+        fields = IngredientSerializer.Meta.fields + ['recipe_count']
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+    """Create or update many recipes with a fixed number of queries"""
+
+    def _resolve_related(self, model, items_by_recipe):
+        """Return each recipe's related objects, resolved in one batch"""
+        all_items = [item for items in items_by_recipe for item in items]
+        objs = {
+            obj.name: obj for obj in
+            self.child._get_or_create_objects(model, all_items)
+        }
+        return [
+            list({item['name']: objs[item['name']] for item in items}.values())
+            for items in items_by_recipe
+        ]
+
+    def _set_related(self, recipes, field_name, model, items_by_recipe,
+                     replace=True):
+        """Replace the links of recipes whose payload listed field_name"""
+        changed = [
+            (recipe, items) for recipe, items in zip(recipes, items_by_recipe)
+            if items is not None
+        ]
+        if not changed:
+            return
+        if replace:
+            through = Recipe._meta.get_field(field_name).remote_field.through
+            through.objects.filter(
+                recipe_id__in=[recipe.id for recipe, _ in changed]
+            ).delete()
+        related = self._resolve_related(model, [items for _, items in changed])
+        self.child._add_related(
+            field_name,
+            zip([recipe for recipe, _ in changed], related),
+        )
+
+    def _finish(self, recipes):
+        """Invalidate caches and load relations for the response"""
+        invalidate_user(self.context['request'].user.id)
+        prefetch_related_objects(recipes, 'tags', 'ingredients')
+        return recipes
+
+    @transaction.atomic
+    def create(self, validated_data):
+        """Create recipes, their tags/ingredients and links in bulk"""
+        tags = [item.pop('tags', None) for item in validated_data]
+        ingredients = [
+            item.pop('ingredients', None) for item in validated_data
+        ]
+        recipes = Recipe.objects.bulk_create(
+            [Recipe(**item) for item in validated_data],
+            batch_size=settings.RECIPE_BULK_BATCH_SIZE,
+        )
+        # new recipes have no links to clear
+        self._set_related(recipes, 'tags', Tag, tags, replace=False)
+        self._set_related(
+            recipes, 'ingredients', Ingredient, ingredients, replace=False
+        )
+
+        return self._finish(recipes)
+
+    @transaction.atomic
+    def update(self, instances, validated_data):
+        """Update recipes in payload order with one bulk update"""
+        tags = [item.pop('tags', None) for item in validated_data]
+        ingredients = [
+            item.pop('ingredients', None) for item in validated_data
+        ]
+        fields = {'updated_at'}
+        now = timezone.now()
+        for recipe, item in zip(instances, validated_data):
+            for attr, value in item.items():
+                setattr(recipe, attr, value)
+                fields.add(attr)
+            # bulk_update does not apply auto_now
+            recipe.updated_at = now
+        Recipe.objects.bulk_update(
+            instances,
+            sorted(fields),
+            batch_size=settings.RECIPE_BULK_BATCH_SIZE,
+        )
+        self._set_related(instances, 'tags', Tag, tags)
+        self._set_related(instances, 'ingredients', Ingredient, ingredients)
+
+        return self._finish(instances)
+
+
 class RecipeSerializer(serializers.ModelSerializer):
     """Serializer for recipes"""
 
@@ -39,30 +151,63 @@ class RecipeSerializer(serializers.ModelSerializer):
             'ingredients'
         ]
         read_only_fields = ['id']
+        list_serializer_class = RecipeListSerializer
 
-    def _get_or_create_tags(self, tags, recipe):
-        """Handle getting or creating tags as needed"""
-        # get authed user
-        auth_user = self.context['request'].user
-        # loop through tags and call create or get the tag from db
-        for tag in tags:
-            tag_obj, created = Tag.objects.get_or_create(
-                user=auth_user,
-                **tag
-            )
-            recipe.tags.add(tag_obj)    
+    def __init__(self, *args, fields=None, **kwargs):
+        """Optionally render only the named fields"""
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
 
-    def _get_or_create_ingredients(self, ingredients, recipe):
-        """Handle getting or creating ingredients as needed""" 
+    def _get_or_create_objects(self, model, items):
+        """Return objects for items, creating missing ones in one batch"""
         auth_user = self.context['request'].user
-        for ingredient in ingredients:
-            ingredient_obj, created = Ingredient.objects.get_or_create(
-                user = auth_user,
-                **ingredient
+        # keep payload order and drop repeated names
+        names = list(dict.fromkeys(item['name'] for item in items))
+        objs = {
+            obj.name: obj for obj in
+            model.objects.filter(user=auth_user, name__in=names)
+        }
+        missing = [name for name in names if name not in objs]
+        if missing:
+            # ON CONFLICT DO NOTHING on the (user, name) unique index, so a
+            # concurrent request inserting the same name cannot duplicate it
+            model.objects.bulk_create(
+                [model(user=auth_user, name=name) for name in missing],
+                ignore_conflicts=True,
             )
-            recipe.ingredients.add(ingredient_obj)
+            # ids are not returned when conflicts are ignored
+            for obj in model.objects.filter(user=auth_user, name__in=missing):
+                objs[obj.name] = obj
+
+        return [objs[name] for name in names]
+
+    def _add_related(self, field_name, links):
+        """Insert (recipe, objs) links with a single m2m table insert"""
+        field = Recipe._meta.get_field(field_name)
+        through = field.remote_field.through
+        recipe_fk = f'{field.m2m_field_name()}_id'
+        related_fk = f'{field.m2m_reverse_field_name()}_id'
+        through.objects.bulk_create(
+            [through(**{recipe_fk: recipe.id, related_fk: obj.id})
+             for recipe, objs in links
+             for obj in objs],
+            batch_size=settings.RECIPE_BULK_BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+    def _get_or_create_tags(self, tags, recipe):
+        """Handle getting or creating tags as needed"""
+        tag_objs = self._get_or_create_objects(Tag, tags)
+        self._add_related('tags', [(recipe, tag_objs)])
 
+    def _get_or_create_ingredients(self, ingredients, recipe):
+        """Handle getting or creating ingredients as needed"""
+        ingredient_objs = self._get_or_create_objects(Ingredient, ingredients)
+        self._add_related('ingredients', [(recipe, ingredient_objs)])
 
+    @transaction.atomic
     def create(self, validated_data):
         """Create a recipe"""
         tags = validated_data.pop('tags',[])
@@ -74,6 +219,7 @@ class RecipeSerializer(serializers.ModelSerializer):
 
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         """Update recipe"""
         tags = validated_data.pop('tags',None)
@@ -100,10 +246,59 @@ class RecipeDetailSerializer(RecipeSerializer):
         fields = RecipeSerializer.Meta.fields + ['description','image']
 
 
+class StreamedImageField(serializers.ImageField):
+    """Image field trusting the checks made while the upload streamed in"""
+
+    def to_internal_value(self, data):
+        # recipe.uploads already read the format and size from the header,
+        # skip opening the whole file with Pillow again
+        if getattr(data, 'image_size', None):
+            return serializers.FileField.to_internal_value(self, data)
+        return super().to_internal_value(data)
+
+
 class RecipeImageSerializer(serializers.ModelSerializer):
     """Serializer for uploading images to recipes"""
+    serializer_field_mapping = {
+        **serializers.ModelSerializer.serializer_field_mapping,
+        models.ImageField: StreamedImageField,
+    }
+
     class Meta:
         model = Recipe
-        fields = ['id','image']
-        read_only_fields = ['id']
-        extra_kwargs = {'image':{'required': 'True'}}
\ No newline at end of file
+        fields = ['id', 'image', 'image_status']
+        read_only_fields = ['id', 'image_status']
+        extra_kwargs = {'image':{'required': 'True'}}
+
+
+class RenditionSerializer(serializers.Serializer):
+    """Serializer for one rendition of a recipe image"""
+    width = serializers.IntegerField()
+    height = serializers.IntegerField()
+    webp = serializers.URLField()
+    jpg = serializers.URLField()
+
+
+class RecipeImageStatusSerializer(serializers.ModelSerializer):
+    """Serializer for the processing status of a recipe image"""
+    image_renditions = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Recipe
+        fields = ['id', 'image', 'image_status', 'image_renditions']
+        read_only_fields = fields
+
+    @extend_schema_field(serializers.DictField(child=RenditionSerializer()))
+    def get_image_renditions(self, recipe):
+        """Return rendition metadata with storage names turned into urls"""
+        request = self.context.get('request')
+        renditions = {}
+        for name, rendition in recipe.image_renditions.items():
+            renditions[name] = dict(rendition)
+            for ext in FORMATS:
+                url = default_storage.url(rendition[ext])
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+                renditions[name][ext] = url
+
+        return renditions
@@ -0,0 +1,94 @@
+"""
+Signal handlers for the recipe apis
+"""
+
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+)
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils import timezone
+
+from core.models import (
+    Recipe,
+    Tag,
+    Ingredient
+)
+
+from recipe.cache import invalidate_user
+from recipe.images import release_image
+
+# Recipe field linking to each related model
+RECIPE_FIELDS = {
+    Tag: 'tags',
+    Ingredient: 'ingredients',
+}
+
+
+def touch_recipes(recipes):
+    """Bump updated_at so recipe etags change with their relations"""
+    recipes.update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_owner_cache(sender, instance, **kwargs):
+    """Invalidate cached responses of the owner of a changed object"""
+    invalidate_user(instance.user_id)
+
+
+@receiver(post_delete, sender=Recipe)
+def release_image_on_delete(sender, instance, **kwargs):
+    """Delete a deleted recipe's image unless other recipes share it"""
+    image_name = instance.image.name
+    if image_name:
+        transaction.on_commit(lambda: release_image(image_name))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def touch_recipes_on_save(sender, instance, created, **kwargs):
+    """Touch the recipes showing a renamed tag or ingredient"""
+    if not created:
+        field = RECIPE_FIELDS[sender]
+        touch_recipes(Recipe.objects.filter(**{field: instance}))
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def touch_recipes_on_delete(sender, instance, **kwargs):
+    """Touch the recipes losing a tag or ingredient"""
+    # before the delete, while the links still exist
+    field = RECIPE_FIELDS[sender]
+    touch_recipes(Recipe.objects.filter(**{field: instance}))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def invalidate_links_cache(sender, instance, action, **kwargs):
+    """Invalidate cached responses when recipe links change"""
+    # instance is the recipe, or the tag/ingredient for reverse changes,
+    # and both belong to the same user
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_user(instance.user_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def touch_recipes_on_link(sender, instance, action, reverse, pk_set,
+                          **kwargs):
+    """Touch the recipes whose tags or ingredients changed"""
+    if not reverse and action in ('post_add', 'post_remove', 'pre_clear'):
+        touch_recipes(Recipe.objects.filter(pk=instance.pk))
+    elif reverse and action in ('post_add', 'post_remove'):
+        touch_recipes(Recipe.objects.filter(pk__in=pk_set))
+    elif reverse and action == 'pre_clear':
+        field = RECIPE_FIELDS[type(instance)]
+        touch_recipes(Recipe.objects.filter(**{field: instance}))
@@ -0,0 +1,364 @@
+"""
+Benchmarks for the recipe api's
+
+Skipped by default because seeding takes a while, run with:
+    RUN_BENCHMARKS=1 python manage.py test recipe.tests.test_benchmarks
+
+RecipeApiBenchmarks writes latency percentiles and query counts to
+BENCHMARK_REPORT (benchmark-report.json by default), sorted so reports
+from two commits can be diffed.
+"""
+import io
+import json
+import os
+import random
+import statistics
+import time
+from decimal import Decimal
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.signals import request_finished, request_started
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from PIL import Image
+
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag
+from core.tests.utils import TempMediaRootMixin
+from recipe.querysets import filter_by_related
+
+RECIPES_URL = reverse('recipe:recipe-list')
+# recipes seeded for the benchmark user
+BENCHMARK_RECIPES = int(os.environ.get('BENCHMARK_RECIPES', 100000))
+BENCHMARK_RUNS = int(os.environ.get('BENCHMARK_RUNS', 20))
+BENCHMARK_USERS = int(os.environ.get('BENCHMARK_USERS', 10))
+BENCHMARK_REPORT = os.environ.get('BENCHMARK_REPORT', 'benchmark-report.json')
+
+
+def timed(func, runs=BENCHMARK_RUNS):
+    """Return the median wall time of func in milliseconds"""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def percentile(sorted_values, fraction):
+    """Return the nearest-rank percentile of sorted values"""
+    index = max(0, round(fraction * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def measure(request, runs=BENCHMARK_RUNS):
+    """Return latency percentiles (ms) and query counts of request()"""
+    timings = []
+    queries = []
+    for i in range(runs):
+        with CaptureQueriesContext(connection) as ctx:
+            start = time.perf_counter()
+            request(i)
+            timings.append((time.perf_counter() - start) * 1000)
+        queries.append(len(ctx))
+    timings.sort()
+
+    return {
+        'runs': runs,
+        'p50_ms': round(percentile(timings, 0.5), 2),
+        'p90_ms': round(percentile(timings, 0.9), 2),
+        'p99_ms': round(percentile(timings, 0.99), 2),
+        'mean_ms': round(statistics.mean(timings), 2),
+        'queries_min': min(queries),
+        'queries_max': max(queries),
+    }
+
+
+@skipUnless(os.environ.get('RUN_BENCHMARKS'), 'set RUN_BENCHMARKS=1 to run')
+class RecipeFilterBenchmarks(TestCase):
+    """Benchmark tag filtering on a large account"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            'bench@example.com',
+            'testpass123',
+        )
+        cls.tags = Tag.objects.bulk_create(
+            [Tag(user=cls.user, name=f'tag {i}') for i in range(50)]
+        )
+        recipes = Recipe.objects.bulk_create(
+            [Recipe(
+                user=cls.user,
+                title=f'recipe {i}',
+                time_minutes=10,
+                price=Decimal('1.00'),
+            ) for i in range(BENCHMARK_RECIPES)],
+            batch_size=5000,
+        )
+        # each recipe gets 3 tags, skewed towards the first few
+        rng = random.Random(0)
+        weights = [1 / (i + 1) for i in range(len(cls.tags))]
+        Through = Recipe.tags.through
+        Through.objects.bulk_create(
+            [Through(recipe_id=recipe.id, tag_id=tag.id)
+             for recipe in recipes
+             for tag in set(rng.choices(cls.tags, weights, k=3))],
+            batch_size=10000,
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_filter_by_tags(self):
+        """Compare the old join + DISTINCT filter with EXISTS filters"""
+        popular, rare = self.tags[0], self.tags[-1]
+        tag_ids = [popular.id, rare.id]
+
+        def legacy_page():
+            # the filter RecipeViewSet used before EXISTS subqueries
+            list(Recipe.objects.filter(
+                user=self.user,
+                tags__id__in=tag_ids,
+            ).order_by('-id').distinct()[:100])
+
+        def exists_page(match_all):
+            queryset = Recipe.objects.filter(user=self.user)
+            list(filter_by_related(
+                queryset, 'tags', tag_ids, match_all
+            ).order_by('-id')[:100])
+
+        def api_page(match):
+            params = {'tags': ','.join(map(str, tag_ids)), 'match': match}
+            res = self.client.get(RECIPES_URL, params)
+            self.assertEqual(res.status_code, 200)
+
+        results = {
+            'legacy join + distinct (query only)': timed(legacy_page),
+            'exists match=any (query only)': timed(lambda: exists_page(False)),
+            'exists match=all (query only)': timed(lambda: exists_page(True)),
+            'match=any (api)': timed(lambda: api_page('any')),
+            'match=all (api)': timed(lambda: api_page('all')),
+        }
+
+        print(f'\n{BENCHMARK_RECIPES} recipes, median of {BENCHMARK_RUNS}')
+        for name, ms in results.items():
+            print(f'  {name:<40} {ms:8.2f} ms')
+
+    def test_search(self):
+        """Time ranked full text search"""
+        def api_search(terms):
+            res = self.client.get(RECIPES_URL, {'search': terms})
+            self.assertEqual(res.status_code, 200)
+
+        results = {
+            'search selective term (api)': timed(
+                lambda: api_search(f'{BENCHMARK_RECIPES // 2}')
+            ),
+            'search rare tag (api)': timed(
+                lambda: api_search(self.tags[-1].name)
+            ),
+        }
+
+        print(f'\n{BENCHMARK_RECIPES} recipes, median of {BENCHMARK_RUNS}')
+        for name, ms in results.items():
+            print(f'  {name:<40} {ms:8.2f} ms')
+
+
+@skipUnless(os.environ.get('RUN_BENCHMARKS'), 'set RUN_BENCHMARKS=1 to run')
+@override_settings(
+    # measure the database path, not the response cache
+    CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        'recipes': {
+            'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+        },
+    },
+    IMAGE_PROCESSING_WORKERS=0,
+)
+class RecipeApiBenchmarks(TempMediaRootMixin, TestCase):
+    """Latency and query counts of the recipe endpoints on seeded data"""
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command(
+            'seed_benchmark_data',
+            users=BENCHMARK_USERS,
+            recipes=BENCHMARK_RECIPES,
+            stdout=io.StringIO(),
+        )
+        # the heaviest account, seeded users are zipf distributed
+        cls.user = get_user_model().objects.get(email='bench0@example.com')
+        cls.recipe_ids = list(
+            Recipe.objects.filter(user=cls.user)
+            .order_by('-id').values_list('id', flat=True)[:BENCHMARK_RUNS]
+        )
+        cls.tag_ids = list(
+            Tag.objects.filter(user=cls.user)
+            .order_by('id').values_list('id', flat=True)[:2]
+        )
+
+    @classmethod
+    def setUpClass(cls):
+        # set outside setUpTestData, which deep copies its attributes
+        # for every test
+        cls.results = {}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        report = {
+            'recipes': BENCHMARK_RECIPES,
+            'users': BENCHMARK_USERS,
+            'runs': BENCHMARK_RUNS,
+            'results': cls.results,
+        }
+        with open(BENCHMARK_REPORT, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f'\nBenchmark report written to {BENCHMARK_REPORT}')
+        for name, result in sorted(cls.results.items()):
+            print(f'  {name:<24} p50 {result["p50_ms"]:8.2f} ms  '
+                  f'p99 {result["p99_ms"]:8.2f} ms  '
+                  f'{result["queries_max"]} queries')
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def record(self, name, request, status_code=200):
+        """Measure request and check every response succeeded"""
+        def checked(i):
+            res = request(i)
+            self.assertEqual(res.status_code, status_code, res.content[:200])
+
+        self.results[name] = measure(checked)
+
+    def detail_url(self, i):
+        return reverse('recipe:recipe-detail', args=[self.recipe_ids[i]])
+
+    def test_list(self):
+        self.record('list', lambda i: self.client.get(RECIPES_URL))
+
+    def test_list_deep_page(self):
+        # follow cursors, each run fetches the next page
+        next_url = [RECIPES_URL]
+
+        def request(i):
+            res = self.client.get(next_url[0])
+            next_url[0] = res.data['next'] or RECIPES_URL
+            return res
+
+        self.record('list next pages', request)
+
+    def test_detail(self):
+        self.record('detail', lambda i: self.client.get(self.detail_url(i)))
+
+    def test_filter(self):
+        params = {'tags': ','.join(map(str, self.tag_ids))}
+        self.record(
+            'filter tags any',
+            lambda i: self.client.get(RECIPES_URL, params),
+        )
+        self.record(
+            'filter tags all',
+            lambda i: self.client.get(RECIPES_URL, {**params, 'match': 'all'}),
+        )
+
+    def test_create(self):
+        def request(i):
+            payload = {
+                'title': f'benchmark recipe {i}',
+                'time_minutes': 30,
+                'price': '7.50',
+                'tags': [{'name': 'curry 1'}, {'name': f'new tag {i}'}],
+                'ingredients': [{'name': 'rice 2'}, {'name': 'garlic 3'}],
+            }
+            return self.client.post(RECIPES_URL, payload, format='json')
+
+        self.record('create', request, status_code=201)
+
+    def test_update(self):
+        def request(i):
+            payload = {
+                'title': f'updated {i}',
+                'tags': [{'name': 'soup 4'}],
+            }
+            return self.client.patch(
+                self.detail_url(i), payload, format='json'
+            )
+
+        self.record('update', request)
+
+    def test_upload_image(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (1200, 900)).save(buffer, format='JPEG')
+
+        def request(i):
+            image_file = io.BytesIO(buffer.getvalue())
+            image_file.name = 'photo.jpg'
+            url = reverse(
+                'recipe:recipe-upload-image', args=[self.recipe_ids[i]]
+            )
+            return self.client.post(
+                url, {'image': image_file}, format='multipart'
+            )
+
+        self.record('upload image', request, status_code=202)
+
+
+@skipUnless(os.environ.get('RUN_BENCHMARKS'), 'set RUN_BENCHMARKS=1 to run')
+class ConnectionOverheadBenchmarks(TransactionTestCase):
+    """Per request connection cost with and without persistent connections"""
+    # the test client disconnects close_old_connections, so the request
+    # signals are sent by hand around a single query
+
+    def setUp(self):
+        self.settings_dict = dict(connection.settings_dict)
+        connection.close()
+
+    def tearDown(self):
+        connection.close()
+        connection.settings_dict.update(self.settings_dict)
+
+    def request(self):
+        request_started.send(sender=self.__class__)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        request_finished.send(sender=self.__class__)
+
+    def test_connection_overhead(self):
+        configs = {
+            'new connection per request': {
+                'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False,
+            },
+            'persistent, no health check': {
+                'CONN_MAX_AGE': 60, 'CONN_HEALTH_CHECKS': False,
+            },
+            'persistent + health check': {
+                'CONN_MAX_AGE': 60, 'CONN_HEALTH_CHECKS': True,
+            },
+        }
+        results = {}
+        for name, config in configs.items():
+            connection.close()
+            connection.settings_dict.update(config)
+            results[name] = timed(self.request, runs=BENCHMARK_RUNS * 10)
+
+        print(f'\nrequest with one query, median of {BENCHMARK_RUNS * 10}')
+        for name, ms in results.items():
+            print(f'  {name:<40} {ms:8.3f} ms')
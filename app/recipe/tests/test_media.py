@@ -0,0 +1,130 @@
+"""
+Tests for the authorized media endpoint
+"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.signals import request_finished
+from django.db import close_old_connections
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe
+from core.tests.utils import TempMediaRootMixin
+from recipe.images import image_storage, rendition_name
+
+
+def media_url(name):
+    """Create and return the url of a media file"""
+    return reverse('media', args=[name])
+
+
+def close_response(res):
+    """Close a streamed response, keeping the test's database connection"""
+    # like the test client does, request_finished would close_old_connections
+    # in the middle of the test transaction
+    request_finished.disconnect(close_old_connections)
+    try:
+        res.close()
+    finally:
+        request_finished.connect(close_old_connections)
+
+
+@override_settings(MEDIA_ACCEL_REDIRECT_URL='/protected/media/')
+class MediaTests(TempMediaRootMixin, TestCase):
+    """Test serving uploaded images"""
+
+    def setUp(self):
+        super().setUp()
+
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.image = image_storage().save(
+            'uploads/recipe/photo.jpg', ContentFile(b'image bytes')
+        )
+        self.recipe = Recipe.objects.create(
+            user=self.user,
+            title='Sample recipe',
+            time_minutes=10,
+            price=Decimal('1.00'),
+            image=self.image,
+        )
+
+    def test_image_url_uses_endpoint(self):
+        """Test stored images link to the media endpoint"""
+        self.assertEqual(self.recipe.image.url, media_url(self.image))
+
+    def test_owner_gets_accel_redirect(self):
+        """Test the owner gets an X-Accel-Redirect instead of the bytes"""
+        res = self.client.get(media_url(self.image))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            res['X-Accel-Redirect'], f'/protected/media/{self.image}'
+        )
+        self.assertEqual(res['Content-Type'], 'image/jpeg')
+        self.assertIn('private', res['Cache-Control'])
+        self.assertEqual(res.content, b'')
+
+    def test_rendition_of_owned_image(self):
+        """Test renditions are authorized through their source image"""
+        name = rendition_name(self.image, 'thumbnail', 'webp')
+
+        res = self.client.get(media_url(name))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['X-Accel-Redirect'], f'/protected/media/{name}')
+
+    def test_other_users_image_not_found(self):
+        """Test images of other users' recipes are not served"""
+        other = get_user_model().objects.create_user(
+            'other@example.com',
+            'password123',
+        )
+        self.client.force_authenticate(other)
+        name = rendition_name(self.image, 'thumbnail', 'jpg')
+
+        for url in (media_url(self.image), media_url(name)):
+            res = self.client.get(url)
+            self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+            self.assertNotIn('X-Accel-Redirect', res)
+
+    def test_auth_required(self):
+        """Test anonymous requests are rejected"""
+        res = APIClient().get(media_url(self.image))
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_path_traversal_rejected(self):
+        """Test names outside the upload directory are not served"""
+        for name in (
+            f'uploads/recipe/../../{self.image}',
+            'uploads/../secret.txt',
+            'static/admin.css',
+        ):
+            res = self.client.get(media_url(name))
+            self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_served_directly_without_proxy(self):
+        """Test the file itself is sent when no proxy is configured"""
+        with self.settings(MEDIA_ACCEL_REDIRECT_URL=''):
+            res = self.client.get(media_url(self.image))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(res.streaming_content), b'image bytes')
+        close_response(res)
+
+    def test_rendition_url_uses_endpoint(self):
+        """Test rendition urls point at the media endpoint"""
+        name = rendition_name(self.image, 'medium', 'jpg')
+
+        self.assertEqual(default_storage.url(name), media_url(name))
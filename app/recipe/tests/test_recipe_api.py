@@ -9,7 +9,9 @@ import tempfile
 import os
 from PIL import Image
 
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from rest_framework import status
@@ -20,10 +22,13 @@ from core.models import (
     Tag,
     Ingredient    
 )
+from core.tests.utils import TempMediaRootMixin
 from recipe.serializers import (
     RecipeSerializer,
     RecipeDetailSerializer,
+    RecipeImageSerializer,
 )
+from recipe.querysets import get_prefetch_fields
 
 
 
@@ -54,6 +59,23 @@ def create_user(**params):
     """Create and return a new user"""
     return get_user_model().objects.create_user(**params)
 
+
+def create_recipe_with_relations(user, **params):
+    """Create and return a sample recipe with a tag and an ingredient"""
+    recipe = create_recipe(user=user, **params)
+    recipe.tags.add(Tag.objects.create(user=user, name=f'tag {recipe.id}'))
+    recipe.ingredients.add(
+        Ingredient.objects.create(user=user, name=f'ing {recipe.id}')
+    )
+    return recipe
+
+
+def count_queries(func):
+    """Return the number of queries executed by func"""
+    with CaptureQueriesContext(connection) as ctx:
+        func()
+    return len(ctx.captured_queries)
+
 class PublicRecipeAPITests(TestCase):
     """Test unathenticated api requests"""
     def setUP(self):
@@ -84,7 +106,7 @@ class PrivateRecipeAPITests(TestCase):
         # many = true, to pass in list of items
         serializer = RecipeSerializer(recipes, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_recipe_list_limited_to_user(self):
         """Test list of recipes is limitied to authed user"""
@@ -97,7 +119,35 @@ class PrivateRecipeAPITests(TestCase):
         recipes = Recipe.objects.filter(user=self.user)
         serializer = RecipeSerializer(recipes, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
+
+    def test_recipe_list_cursor_pagination(self):
+        """Test paging through recipes with opaque cursors"""
+        recipes = [create_recipe(user=self.user) for _ in range(5)]
+
+        res = self.client.get(RECIPES_URL, {'page_size': 2})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIsNone(res.data['previous'])
+        seen = [r['id'] for r in res.data['results']]
+        while res.data['next']:
+            res = self.client.get(res.data['next'])
+            self.assertLessEqual(len(res.data['results']), 2)
+            seen.extend(r['id'] for r in res.data['results'])
+
+        self.assertEqual(seen, [r.id for r in reversed(recipes)])
+
+    def test_recipe_list_page_does_not_use_offset(self):
+        """Test later pages are fetched with a keyset filter"""
+        for _ in range(3):
+            create_recipe(user=self.user)
+        res = self.client.get(RECIPES_URL, {'page_size': 1})
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(res.data['next'])
+
+        sql = ctx.captured_queries[0]['sql']
+        self.assertIn('"core_recipe"."id" <', sql)
+        self.assertNotIn('OFFSET', sql)
 
     def test_get_recipe_detail(self):
         """Test get recipe detail"""
@@ -411,10 +461,10 @@ class PrivateRecipeAPITests(TestCase):
         s1 = RecipeSerializer(r1)
         s2 = RecipeSerializer(r2)
         s3 = RecipeSerializer(r3)
-        self.assertIn(s1.data, res.data)
-        self.assertIn(s2.data, res.data)
+        self.assertIn(s1.data, res.data['results'])
+        self.assertIn(s2.data, res.data['results'])
         # tag was not specified for s3
-        self.assertNotIn(s3.data, res.data)
+        self.assertNotIn(s3.data, res.data['results'])
 
 
     def test_filter_by_ingredients(self):
@@ -435,17 +485,246 @@ class PrivateRecipeAPITests(TestCase):
         s1 = RecipeSerializer(r1)
         s2 = RecipeSerializer(r2)
         s3 = RecipeSerializer(r3)
-        self.assertIn(s1.data, res.data)
-        self.assertIn(s2.data, res.data)
+        self.assertIn(s1.data, res.data['results'])
+        self.assertIn(s2.data, res.data['results'])
         # tag was not specified for s3
-        self.assertNotIn(s3.data, res.data)
+        self.assertNotIn(s3.data, res.data['results'])
+
 
 
+    def test_filter_by_tags_match_all(self):
+        """Test match=all only returns recipes with every listed tag"""
+        tag1 = Tag.objects.create(user=self.user, name='vegan')
+        tag2 = Tag.objects.create(user=self.user, name='quick')
+        r1 = create_recipe(user=self.user, title='salad')
+        r1.tags.add(tag1, tag2)
+        r2 = create_recipe(user=self.user, title='stew')
+        r2.tags.add(tag1)
+
+        params = {'tags': f'{tag1.id},{tag2.id}', 'match': 'all'}
+        res = self.client.get(RECIPES_URL, params)
 
-class ImageUploadTests(TestCase):
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [r['id'] for r in res.data['results']],
+            [r1.id],
+        )
+
+    def test_filter_by_tags_does_not_duplicate_or_distinct(self):
+        """Test a recipe matching several tags is listed once"""
+        tag1 = Tag.objects.create(user=self.user, name='vegan')
+        tag2 = Tag.objects.create(user=self.user, name='quick')
+        recipe = create_recipe(user=self.user)
+        recipe.tags.add(tag1, tag2)
+
+        params = {'tags': f'{tag1.id},{tag2.id}'}
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(RECIPES_URL, params)
+
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertNotIn('DISTINCT', ctx.captured_queries[0]['sql'])
+
+    def test_filter_invalid_match_error(self):
+        """Test an unknown match mode is rejected"""
+        res = self.client.get(RECIPES_URL, {'tags': '1', 'match': 'some'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_search_recipes(self):
+        """Test searching recipes by title, description, tags, ingredients"""
+        r1 = create_recipe(user=self.user, title='Green curry')
+        r2 = create_recipe(
+            user=self.user,
+            title='Stew',
+            description='A slow cooked curry',
+        )
+        r3 = create_recipe(user=self.user, title='Tacos')
+        r3.tags.add(Tag.objects.create(user=self.user, name='curries'))
+        create_recipe(user=self.user, title='Pancakes')
+        other_user = create_user(
+            email='other@example.com', password='pass1234'
+        )
+        create_recipe(user=other_user, title='Red curry')
+
+        res = self.client.get(RECIPES_URL, {'search': 'curry'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        ids = [r['id'] for r in res.data['results']]
+        # title matches rank above tag matches above description matches
+        self.assertEqual(ids, [r1.id, r3.id, r2.id])
+
+    def test_search_follows_tag_and_ingredient_changes(self):
+        """Test the search index is updated when relations change"""
+        recipe = create_recipe(user=self.user, title='Soup')
+        ingredient = Ingredient.objects.create(user=self.user, name='leek')
+        recipe.ingredients.add(ingredient)
+
+        res = self.client.get(RECIPES_URL, {'search': 'leek'})
+        self.assertEqual(len(res.data['results']), 1)
+
+        ingredient.name = 'potato'
+        ingredient.save()
+        res = self.client.get(RECIPES_URL, {'search': 'leek'})
+        self.assertEqual(len(res.data['results']), 0)
+
+        recipe.ingredients.clear()
+        res = self.client.get(RECIPES_URL, {'search': 'potato'})
+        self.assertEqual(len(res.data['results']), 0)
+
+    def test_search_pagination(self):
+        """Test paging through ranked search results"""
+        for i in range(5):
+            create_recipe(user=self.user, title='curry ' * (i + 1))
+        create_recipe(user=self.user, title='Tacos')
+
+        res = self.client.get(RECIPES_URL, {'search': 'curry', 'page_size': 2})
+        seen = [r['id'] for r in res.data['results']]
+        while res.data['next']:
+            res = self.client.get(res.data['next'])
+            seen.extend(r['id'] for r in res.data['results'])
+
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(len(set(seen)), 5)
+
+    def test_create_recipe_queries_do_not_grow_with_relations(self):
+        """Test round trips to create a recipe do not depend on its size"""
+        Tag.objects.create(user=self.user, name='existing')
+
+        def create(size):
+            payload = {
+                'title': f'Recipe {size}',
+                'time_minutes': 10,
+                'price': Decimal('1.00'),
+                'tags': [{'name': 'existing'}] + [
+                    {'name': f'tag {size} {i}'} for i in range(size)
+                ],
+                'ingredients': [
+                    {'name': f'ing {size} {i}'} for i in range(size)
+                ],
+            }
+            res = self.client.post(RECIPES_URL, payload, format='json')
+            self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+            self.assertEqual(len(res.data['tags']), size + 1)
+            self.assertEqual(len(res.data['ingredients']), size)
+
+        self.assertEqual(
+            count_queries(lambda: create(1)),
+            count_queries(lambda: create(30)),
+        )
+
+    def test_update_recipe_queries_do_not_grow_with_relations(self):
+        """Test round trips to replace recipe tags do not depend on size"""
+        recipe = create_recipe(user=self.user)
+        url = detail_url(recipe.id)
+
+        def update(size):
+            payload = {'tags': [{'name': f'tag {i}'} for i in range(size)]}
+            res = self.client.patch(url, payload, format='json')
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        self.assertEqual(
+            count_queries(lambda: update(1)),
+            count_queries(lambda: update(30)),
+        )
+        self.assertEqual(recipe.tags.count(), 30)
+
+    def test_create_recipe_with_repeated_tag(self):
+        """Test repeating a tag name in the payload links it once"""
+        payload = {
+            'title': 'Soup',
+            'time_minutes': 10,
+            'price': Decimal('1.00'),
+            'tags': [{'name': 'Hot'}, {'name': 'Hot'}],
+        }
+        res = self.client.post(RECIPES_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(len(res.data['tags']), 1)
+
+    def assertQueriesDoNotGrow(self, url, add_row, params=None):
+        """Assert the query count for url is the same with more rows"""
+        add_row()
+        small = count_queries(lambda: self.client.get(url, params))
+        for _ in range(5):
+            add_row()
+        large = count_queries(lambda: self.client.get(url, params))
+
+        self.assertEqual(small, large)
+
+    def test_list_queries_do_not_grow_with_page_size(self):
+        """Test listing recipes does not run a query per recipe"""
+        self.assertQueriesDoNotGrow(
+            RECIPES_URL,
+            lambda: create_recipe_with_relations(user=self.user),
+        )
+
+    def test_prefetch_fields_follow_serializer(self):
+        """Test only relations rendered by the serializer are prefetched"""
+        self.assertEqual(
+            get_prefetch_fields(RecipeDetailSerializer()),
+            ['tags', 'ingredients'],
+        )
+        self.assertEqual(get_prefetch_fields(RecipeImageSerializer()), [])
+
+    def test_list_selected_fields(self):
+        """Test fields= limits the list to the named fields and columns"""
+        create_recipe_with_relations(user=self.user)
+
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(RECIPES_URL, {'fields': 'id,title'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(res.data['results'][0]), ['id', 'title'])
+        sql = ' '.join(query['sql'] for query in ctx.captured_queries)
+        # no columns or relations that are not rendered
+        self.assertNotIn('"core_recipe"."price"', sql)
+        self.assertNotIn('core_recipe_tags', sql)
+        self.assertNotIn('core_recipe_ingredients', sql)
+
+    def test_list_expand_detail_fields(self):
+        """Test expand= adds detail fields to the default list fields"""
+        create_recipe(user=self.user, description='Slow cooked')
+
+        res = self.client.get(RECIPES_URL, {'expand': 'description'})
+
+        recipe = res.data['results'][0]
+        self.assertEqual(recipe['description'], 'Slow cooked')
+        self.assertIn('tags', recipe)
+        self.assertNotIn('image', recipe)
+
+    def test_detail_selected_fields(self):
+        """Test fields= applies to the recipe detail"""
+        recipe = create_recipe(user=self.user, title='Stew')
+
+        res = self.client.get(detail_url(recipe.id), {'fields': 'title,tags'})
+
+        self.assertEqual(res.data, {'title': 'Stew', 'tags': []})
+
+    def test_selected_fields_unknown_error(self):
+        """Test asking for unknown fields returns an error"""
+        res = self.client.get(RECIPES_URL, {'fields': 'id,user'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_update_after_sparse_detail(self):
+        """Test updates still save every field after sparse reads"""
+        recipe = create_recipe(user=self.user, title='Old')
+        self.client.get(detail_url(recipe.id), {'fields': 'id'})
+
+        res = self.client.patch(detail_url(recipe.id), {'title': 'New'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, 'New')
+        self.assertEqual(res.data['description'], recipe.description)
+
+
+class ImageUploadTests(TempMediaRootMixin, TestCase):
     """Tests for the image upload API"""
 
     def setUp(self):
+        super().setUp()
         self.client = APIClient()
         self.user = get_user_model().objects.create_user(
             'user@example.com',
@@ -454,10 +733,6 @@ class ImageUploadTests(TestCase):
         self.client.force_authenticate(self.user)
         self.recipe = create_recipe(user = self.user)
 
-    def tearDown(self):
-        # we dont want to be building up test images on our machine
-        self.recipe.image.delete()
-
     def test_upload_image(self):
         """Test uploading an image to a recipe."""
         url = image_upload_url(self.recipe.id)
@@ -471,8 +746,10 @@ class ImageUploadTests(TestCase):
             res = self.client.post(url, payload, format='multipart')
         
         self.recipe.refresh_from_db()
-        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        # processing continues in the background
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
         self.assertIn('image',res.data)
+        self.assertEqual(res.data['image_status'], 'pending')
         self.assertTrue(os.path.exists(self.recipe.image.path))
 
     def test_upload_image_bad_request(self):
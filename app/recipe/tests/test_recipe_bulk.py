@@ -0,0 +1,226 @@
+"""
+Tests for the bulk recipe api
+"""
+
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import (
+    Recipe,
+    Tag,
+)
+
+
+BULK_URL = reverse('recipe:recipe-bulk')
+
+
+def create_user(email='user@example.com', password='testpass123'):
+    """Create and return a new user"""
+    return get_user_model().objects.create_user(email=email, password=password)
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe"""
+    defaults = {
+        'title': 'sample recipe title',
+        'time_minutes': 22,
+        'price': Decimal('5.25'),
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+def recipe_payload(i):
+    """Return a recipe payload with a shared and an own tag"""
+    return {
+        'title': f'recipe {i}',
+        'time_minutes': 10 + i,
+        'price': '2.50',
+        'tags': [{'name': 'shared'}, {'name': f'tag {i}'}],
+        'ingredients': [{'name': f'ingredient {i}'}],
+    }
+
+
+class BulkRecipeApiTests(TestCase):
+    """Test bulk create, update and delete"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user()
+        self.client.force_authenticate(self.user)
+
+    def count_queries(self, method, payload):
+        with CaptureQueriesContext(connection) as ctx:
+            res = getattr(self.client, method)(
+                BULK_URL, payload, format='json'
+            )
+        return res, len(ctx)
+
+    def test_bulk_create(self):
+        """Test creating many recipes with their tags and ingredients"""
+        res = self.client.post(
+            BULK_URL, [recipe_payload(i) for i in range(3)], format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            [item['title'] for item in res.data],
+            ['recipe 0', 'recipe 1', 'recipe 2'],
+        )
+        recipes = Recipe.objects.filter(user=self.user)
+        self.assertEqual(recipes.count(), 3)
+        self.assertEqual(Tag.objects.filter(name='shared').count(), 1)
+        recipe = recipes.get(title='recipe 1')
+        self.assertEqual(
+            sorted(recipe.tags.values_list('name', flat=True)),
+            ['shared', 'tag 1'],
+        )
+        self.assertEqual(recipe.ingredients.get().name, 'ingredient 1')
+
+    def test_bulk_create_query_count_is_constant(self):
+        """Test bulk create queries do not grow with the item count"""
+        _, few = self.count_queries(
+            'post', [recipe_payload(i) for i in range(2)]
+        )
+        _, many = self.count_queries(
+            'post', [recipe_payload(i) for i in range(10, 40)]
+        )
+
+        self.assertEqual(few, many)
+
+    def test_bulk_create_reports_item_errors(self):
+        """Test invalid items are reported by position and nothing is saved"""
+        payload = [recipe_payload(0), {'title': 'no time or price'}]
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data[0], {})
+        self.assertIn('time_minutes', res.data[1])
+        self.assertFalse(Recipe.objects.exists())
+
+    @override_settings(RECIPE_BULK_MAX_ITEMS=2)
+    def test_bulk_request_size_limited(self):
+        """Test requests above the item limit are rejected"""
+        payload = [recipe_payload(i) for i in range(3)]
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_bulk_update(self):
+        """Test partially updating many recipes"""
+        r1 = create_recipe(self.user, title='one')
+        r2 = create_recipe(self.user, title='two')
+        r1.tags.add(Tag.objects.create(user=self.user, name='old'))
+        updated_at = Recipe.objects.get(pk=r2.pk).updated_at
+        payload = [
+            {'id': r2.id, 'price': '9.99'},
+            {'id': r1.id, 'title': 'first', 'tags': [{'name': 'new'}]},
+        ]
+        res = self.client.patch(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in res.data], [r2.id, r1.id])
+        r1.refresh_from_db()
+        r2.refresh_from_db()
+        self.assertEqual(r1.title, 'first')
+        self.assertEqual(list(r1.tags.values_list('name', flat=True)), ['new'])
+        self.assertEqual(r2.title, 'two')
+        self.assertEqual(r2.price, Decimal('9.99'))
+        self.assertGreater(r2.updated_at, updated_at)
+
+    def test_bulk_update_query_count_is_constant(self):
+        """Test bulk update queries do not grow with the item count"""
+        recipes = [create_recipe(self.user) for _ in range(30)]
+
+        def payload(recipes):
+            return [
+                {'id': recipe.id, 'title': 'changed',
+                 'tags': [{'name': 'shared'}, {'name': f'tag {recipe.id}'}]}
+                for recipe in recipes
+            ]
+
+        _, few = self.count_queries('patch', payload(recipes[:2]))
+        _, many = self.count_queries('patch', payload(recipes[2:]))
+
+        self.assertEqual(few, many)
+
+    def test_bulk_update_other_users_recipe_error(self):
+        """Test updating another user's recipe reports that item"""
+        other = create_recipe(create_user(email='other@example.com'))
+        own = create_recipe(self.user)
+        payload = [
+            {'id': own.id, 'title': 'changed'},
+            {'id': other.id, 'title': 'changed'},
+        ]
+        res = self.client.patch(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data[0], {})
+        self.assertIn('id', res.data[1])
+        other.refresh_from_db()
+        own.refresh_from_db()
+        self.assertNotEqual(other.title, 'changed')
+        self.assertNotEqual(own.title, 'changed')
+
+    def test_bulk_duplicate_ids_error(self):
+        """Test listing a recipe twice reports the repeat without writing"""
+        recipe = create_recipe(self.user)
+        payload = [
+            {'id': recipe.id, 'title': 'first'},
+            {'id': recipe.id, 'title': 'second'},
+        ]
+        res = self.client.patch(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data, [{}, {'id': ['Duplicate id.']}])
+        recipe.refresh_from_db()
+        self.assertNotIn(recipe.title, ('first', 'second'))
+
+        res = self.client.delete(
+            BULK_URL, [recipe.id, recipe.id], format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data[1], {'id': ['Duplicate id.']})
+        self.assertTrue(Recipe.objects.filter(id=recipe.id).exists())
+
+    def test_bulk_delete(self):
+        """Test deleting many recipes by id"""
+        recipes = [create_recipe(self.user) for _ in range(3)]
+        res = self.client.delete(
+            BULK_URL, [recipes[0].id, recipes[2].id], format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(
+            list(Recipe.objects.values_list('id', flat=True)),
+            [recipes[1].id],
+        )
+
+    def test_bulk_delete_other_users_recipe_error(self):
+        """Test deleting another user's recipe fails without deleting"""
+        other = create_recipe(create_user(email='other@example.com'))
+        own = create_recipe(self.user)
+        res = self.client.delete(BULK_URL, [own.id, other.id], format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data[0], {})
+        self.assertIn('id', res.data[1])
+        self.assertEqual(Recipe.objects.count(), 2)
+
+    def test_bulk_changes_invalidate_list(self):
+        """Test the cached list reflects bulk changes"""
+        self.client.get(reverse('recipe:recipe-list'))
+        self.client.post(BULK_URL, [recipe_payload(0)], format='json')
+        res = self.client.get(reverse('recipe:recipe-list'))
+
+        self.assertEqual(len(res.data['results']), 1)
@@ -0,0 +1,141 @@
+"""
+Tests for the recipe response cache
+"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import (
+    Recipe,
+    Tag,
+)
+from recipe.cache import get_cache, get_user_version
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def detail_url(recipe_id):
+    """Create and return a recipe detail url"""
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe"""
+    defaults = {
+        'title': 'sample recipe title',
+        'time_minutes': 22,
+        'price': Decimal('5.25'),
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class RecipeCacheTests(TestCase):
+    """Test caching of recipe responses"""
+
+    def setUp(self):
+        get_cache().clear()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_list_served_from_cache(self):
+        """Test a repeated list request does not hit the database"""
+        create_recipe(user=self.user)
+        res1 = self.client.get(RECIPES_URL)
+
+        with self.assertNumQueries(0):
+            res2 = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res2.status_code, status.HTTP_200_OK)
+        self.assertEqual(res1.data, res2.data)
+
+    def test_cache_keyed_by_query_params(self):
+        """Test different query params are cached separately"""
+        create_recipe(user=self.user, title='Curry')
+        create_recipe(user=self.user, title='Tacos')
+        self.client.get(RECIPES_URL)
+
+        res = self.client.get(RECIPES_URL, {'search': 'tacos'})
+
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_cache_not_shared_between_users(self):
+        """Test one user's cached response is never served to another"""
+        create_recipe(user=self.user)
+        self.client.get(RECIPES_URL)
+        other = get_user_model().objects.create_user(
+            'other@example.com',
+            'testpass123',
+        )
+        self.client.force_authenticate(other)
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.data['results'], [])
+
+    def test_recipe_save_invalidates(self):
+        """Test saving a recipe invalidates the user's cached responses"""
+        recipe = create_recipe(user=self.user, title='Old')
+        self.client.get(detail_url(recipe.id))
+
+        recipe.title = 'New'
+        recipe.save()
+        res = self.client.get(detail_url(recipe.id))
+
+        self.assertEqual(res.data['title'], 'New')
+
+    def test_update_through_api_invalidates(self):
+        """Test updating a recipe through the api refreshes the list"""
+        recipe = create_recipe(user=self.user)
+        self.client.get(RECIPES_URL)
+
+        self.client.patch(
+            detail_url(recipe.id),
+            {'tags': [{'name': 'Lunch'}]},
+            format='json',
+        )
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.data['results'][0]['tags'][0]['name'], 'Lunch')
+
+    def test_m2m_change_invalidates(self):
+        """Test adding a tag to a recipe invalidates the cache"""
+        recipe = create_recipe(user=self.user)
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        version = get_user_version(self.user.id)
+
+        recipe.tags.add(tag)
+
+        self.assertNotEqual(get_user_version(self.user.id), version)
+
+    def test_tag_delete_invalidates(self):
+        """Test deleting a tag invalidates the cache"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        version = get_user_version(self.user.id)
+
+        tag.delete()
+
+        self.assertNotEqual(get_user_version(self.user.id), version)
+
+    @override_settings(CACHES={
+        'recipes': {
+            'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+        },
+    })
+    def test_works_without_cache(self):
+        """Test the viewset works with caching disabled"""
+        create_recipe(user=self.user)
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['results']), 1)
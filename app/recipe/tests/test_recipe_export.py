@@ -0,0 +1,120 @@
+"""
+Tests for the recipe export api
+"""
+
+import csv
+import io
+import json
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe
+
+
+EXPORT_URL = reverse('recipe:recipe-export')
+
+
+def create_user(email='user@example.com', password='testpass123'):
+    """Create and return a new user"""
+    return get_user_model().objects.create_user(email=email, password=password)
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe with a tag and an ingredient"""
+    defaults = {
+        'title': 'sample recipe title',
+        'time_minutes': 22,
+        'price': Decimal('5.25'),
+    }
+    defaults.update(params)
+    recipe = Recipe.objects.create(user=user, **defaults)
+    recipe.tags.create(user=user, name=f'tag {recipe.id}')
+    recipe.ingredients.create(user=user, name=f'ingredient {recipe.id}')
+    return recipe
+
+
+def read_body(res):
+    """Return the joined body of a streaming response"""
+    return b''.join(res.streaming_content).decode()
+
+
+class RecipeExportApiTests(TestCase):
+    """Test streaming recipe exports"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user()
+        self.client.force_authenticate(self.user)
+
+    def test_auth_required(self):
+        """Test exporting requires authentication"""
+        res = APIClient().get(EXPORT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_export_ndjson(self):
+        """Test the default export is one recipe per line"""
+        r1 = create_recipe(self.user, title='first')
+        r2 = create_recipe(self.user, title='second')
+        create_recipe(create_user(email='other@example.com'))
+
+        res = self.client.get(EXPORT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res.streaming)
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+        lines = [json.loads(line) for line in read_body(res).splitlines()]
+        self.assertEqual([line['id'] for line in lines], [r2.id, r1.id])
+        self.assertEqual(lines[1]['title'], 'first')
+        self.assertEqual(lines[1]['price'], '5.25')
+        self.assertEqual(lines[1]['tags'][0]['name'], f'tag {r1.id}')
+
+    def test_export_csv(self):
+        """Test ?format=csv exports a header and one row per recipe"""
+        recipe = create_recipe(self.user, title='with, comma')
+        recipe.tags.create(user=self.user, name='extra')
+
+        res = self.client.get(EXPORT_URL, {'format': 'csv'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'text/csv')
+        self.assertIn('recipes.csv', res['Content-Disposition'])
+        rows = list(csv.DictReader(io.StringIO(read_body(res))))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['title'], 'with, comma')
+        self.assertEqual(
+            sorted(rows[0]['tags'].split(';')), ['extra', f'tag {recipe.id}']
+        )
+
+    def test_export_applies_filters(self):
+        """Test the list filters also narrow the export"""
+        r1 = create_recipe(self.user)
+        create_recipe(self.user)
+        tag = r1.tags.get()
+
+        res = self.client.get(EXPORT_URL, {'tags': str(tag.id)})
+
+        lines = read_body(res).splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in lines], [r1.id])
+
+    @override_settings(RECIPE_EXPORT_CHUNK_SIZE=2)
+    def test_export_prefetches_per_chunk(self):
+        """Test relations are loaded once per chunk, not once per recipe"""
+        for _ in range(5):
+            create_recipe(self.user)
+
+        res = self.client.get(EXPORT_URL)
+        with CaptureQueriesContext(connection) as ctx:
+            lines = read_body(res).splitlines()
+
+        self.assertEqual(len(lines), 5)
+        # the cursor query plus tags and ingredients for each of 3 chunks
+        self.assertEqual(len(ctx), 1 + 3 * 2)
@@ -0,0 +1,292 @@
+"""
+Tests for the recipe image pipeline
+"""
+import io
+from decimal import Decimal
+from unittest.mock import patch
+
+from PIL import Image
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import routers
+from core.models import Recipe
+from core.tests.utils import TempMediaRootMixin
+from recipe.images import (
+    RENDITIONS,
+    encode_renditions,
+    image_storage,
+    process_recipe_image,
+    rendition_names,
+)
+
+
+def image_upload_url(recipe_id):
+    """Create and return a recipe image upload url"""
+    return reverse('recipe:recipe-upload-image', args=[recipe_id])
+
+
+def image_status_url(recipe_id):
+    """Create and return a recipe image status url"""
+    return reverse('recipe:recipe-image-status', args=[recipe_id])
+
+
+def make_image(size=(1600, 1200), exif_orientation=None):
+    """Return an in-memory jpeg upload"""
+    img = Image.new('RGB', size, color=(200, 30, 30))
+    exif = Image.Exif()
+    exif[0x010F] = 'Test camera'  # Make
+    if exif_orientation:
+        exif[0x0112] = exif_orientation
+    image_file = io.BytesIO()
+    img.save(image_file, format='JPEG', exif=exif.tobytes())
+    image_file.name = 'photo.jpg'
+    image_file.seek(0)
+    return image_file
+
+
+@override_settings(IMAGE_PROCESSING_WORKERS=0)
+class RecipeImagePipelineTests(TempMediaRootMixin, TestCase):
+    """Test processing uploaded recipe images"""
+
+    def setUp(self):
+        super().setUp()
+
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(
+            user=self.user,
+            title='Sample recipe',
+            time_minutes=10,
+            price=Decimal('1.00'),
+        )
+
+    def upload(self, image_file):
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.client.post(
+                image_upload_url(self.recipe.id),
+                {'image': image_file},
+                format='multipart',
+            )
+        self.recipe.refresh_from_db()
+        return res
+
+    def test_upload_creates_renditions(self):
+        """Test each rendition is written in webp and jpeg"""
+        res = self.upload(make_image())
+
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(self.recipe.image_status, 'ready')
+        self.assertEqual(set(self.recipe.image_renditions), set(RENDITIONS))
+        for name, size in RENDITIONS.items():
+            rendition = self.recipe.image_renditions[name]
+            self.assertEqual(rendition['width'], size)
+            self.assertAlmostEqual(rendition['height'], size * 3 / 4, delta=1)
+            with default_storage.open(rendition['webp']) as f:
+                self.assertEqual(Image.open(f).format, 'WEBP')
+            with default_storage.open(rendition['jpg']) as f:
+                img = Image.open(f)
+                self.assertEqual(img.format, 'JPEG')
+                self.assertEqual(img.width, size)
+
+    def test_renditions_strip_exif(self):
+        """Test renditions are rotated upright and carry no exif"""
+        # orientation 6 means the camera was rotated 90 degrees
+        self.upload(make_image(exif_orientation=6))
+
+        rendition = self.recipe.image_renditions['medium']
+        self.assertEqual(rendition['width'], 450)
+        self.assertEqual(rendition['height'], 600)
+        with default_storage.open(rendition['jpg']) as f:
+            self.assertEqual(len(Image.open(f).getexif()), 0)
+
+    def test_smaller_originals_are_not_upscaled(self):
+        """Test renditions never exceed the original size"""
+        self.upload(make_image(size=(300, 200)))
+
+        large = self.recipe.image_renditions['large']
+        self.assertEqual((large['width'], large['height']), (300, 200))
+
+    def test_transparency_kept(self):
+        """Test transparent greyscale images keep their alpha in webp"""
+        image_file = io.BytesIO()
+        Image.new('LA', (300, 200), color=(128, 0)).save(image_file, 'PNG')
+        image_file.name = 'photo.png'
+        image_file.seek(0)
+
+        self.upload(image_file)
+
+        rendition = self.recipe.image_renditions['thumbnail']
+        with default_storage.open(rendition['webp']) as f:
+            img = Image.open(f)
+            self.assertEqual(img.mode, 'RGBA')
+            self.assertEqual(img.getpixel((0, 0))[3], 0)
+        with default_storage.open(rendition['jpg']) as f:
+            self.assertEqual(Image.open(f).mode, 'RGB')
+
+    def test_image_status_endpoint(self):
+        """Test retrieving the processing status and rendition urls"""
+        self.upload(make_image())
+
+        res = self.client.get(image_status_url(self.recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['image_status'], 'ready')
+        url = res.data['image_renditions']['thumbnail']['webp']
+        self.assertTrue(url.startswith('http://testserver/'))
+        self.assertTrue(url.endswith('-thumbnail.webp'))
+
+    @patch('recipe.images.encode_renditions', side_effect=OSError)
+    def test_processing_failure_marks_failed(self, patched_encode):
+        """Test a failure while processing is reported in the status"""
+        self.upload(make_image())
+
+        self.assertEqual(self.recipe.image_status, 'failed')
+        self.assertEqual(self.recipe.image_renditions, {})
+
+    def test_replaced_image_result_discarded(self):
+        """Test a result for an image replaced meanwhile is not stored"""
+        with self.captureOnCommitCallbacks(execute=False):
+            self.client.post(
+                image_upload_url(self.recipe.id),
+                {'image': make_image()},
+                format='multipart',
+            )
+
+        def replace_image(*args):
+            # a newer upload lands while this one is being processed
+            Recipe.objects.filter(pk=self.recipe.pk).update(
+                image='uploads/recipe/newer.jpg'
+            )
+            return {}
+
+        with patch('recipe.images.encode_renditions', replace_image):
+            process_recipe_image(self.recipe.id)
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_status, 'pending')
+
+    @override_settings(DATABASE_REPLICAS=['replica1'])
+    def test_processed_image_pins_reads_to_primary(self):
+        """Test the user reads the processed row from the primary"""
+        with self.captureOnCommitCallbacks(execute=False):
+            self.client.post(
+                image_upload_url(self.recipe.id),
+                {'image': make_image()},
+                format='multipart',
+            )
+        cache = caches[settings.RECIPE_CACHE_ALIAS]
+        # the upload request's own pin has expired by now
+        cache.delete(routers._pin_key(self.user.id))
+
+        process_recipe_image(self.recipe.id)
+
+        self.assertTrue(cache.get(routers._pin_key(self.user.id)))
+
+
+@override_settings(IMAGE_PROCESSING_WORKERS=0, IMAGE_GC_GRACE_SECONDS=0)
+class RecipeImageDedupTests(TempMediaRootMixin, TestCase):
+    """Test sharing and releasing identical recipe images"""
+
+    def setUp(self):
+        super().setUp()
+
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+        self.client.force_authenticate(self.user)
+        self.image_bytes = make_image().getvalue()
+
+    def create_recipe(self):
+        return Recipe.objects.create(
+            user=self.user,
+            title='Sample recipe',
+            time_minutes=10,
+            price=Decimal('1.00'),
+        )
+
+    def upload(self, recipe, image_bytes=None):
+        image_file = io.BytesIO(image_bytes or self.image_bytes)
+        image_file.name = 'photo.jpg'
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.client.post(
+                image_upload_url(recipe.id),
+                {'image': image_file},
+                format='multipart',
+            )
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        recipe.refresh_from_db()
+
+    def assertStored(self, image_name, stored=True):
+        self.assertEqual(image_storage().exists(image_name), stored)
+        for name in rendition_names(image_name):
+            self.assertEqual(default_storage.exists(name), stored)
+
+    def test_identical_uploads_share_file_and_renditions(self):
+        """Test re-uploading the same photo stores and encodes it once"""
+        recipe1 = self.create_recipe()
+        recipe2 = self.create_recipe()
+
+        with patch(
+            'recipe.images.encode_renditions', wraps=encode_renditions
+        ) as patched_encode:
+            self.upload(recipe1)
+            self.upload(recipe2)
+
+        self.assertEqual(recipe1.image.name, recipe2.image.name)
+        self.assertEqual(recipe1.image_renditions, recipe2.image_renditions)
+        self.assertEqual(recipe2.image_status, 'ready')
+        patched_encode.assert_called_once()
+
+    def test_replaced_image_released(self):
+        """Test replacing an image deletes the old file and renditions"""
+        recipe = self.create_recipe()
+        self.upload(recipe)
+        old_name = recipe.image.name
+
+        self.upload(recipe, make_image(size=(800, 600)).getvalue())
+
+        self.assertNotEqual(recipe.image.name, old_name)
+        self.assertStored(old_name, stored=False)
+        self.assertStored(recipe.image.name)
+
+    def test_shared_image_kept_while_referenced(self):
+        """Test an image is kept while another recipe still uses it"""
+        recipe1 = self.create_recipe()
+        recipe2 = self.create_recipe()
+        self.upload(recipe1)
+        self.upload(recipe2)
+        shared = recipe1.image.name
+
+        self.upload(recipe1, make_image(size=(800, 600)).getvalue())
+        self.assertStored(shared)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe2.delete()
+        self.assertStored(shared, stored=False)
+
+    @override_settings(IMAGE_GC_GRACE_SECONDS=3600)
+    def test_recent_images_left_for_gc(self):
+        """Test images touched within the grace period are not released"""
+        recipe = self.create_recipe()
+        self.upload(recipe)
+        name = recipe.image.name
+
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.delete()
+
+        self.assertTrue(image_storage().exists(name))
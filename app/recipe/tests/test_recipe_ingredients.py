@@ -2,6 +2,8 @@
 Tests for ingredients api
 """
 
+from decimal import Decimal
+
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django.test import TestCase
@@ -9,7 +11,7 @@ from django.test import TestCase
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from core.models import Ingredient
+from core.models import Ingredient, Recipe
 
 from recipe.serializers import IngredientSerializer
 
@@ -47,11 +49,15 @@ class PrivateIngredientsApiTests(TestCase):
         Ingredient.objects.create(user = self.user, name = 'Vanilla')
 
         res = self.client.get(INGREDIENTS_URL)
-        ingredients = Ingredient.objects.all().order_by('-name')
+        ingredients = Ingredient.objects.all().order_by('-id')
         serializer = IngredientSerializer(ingredients, many=True)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(
+            res.data['results'],
+            [{**ingredient, 'recipe_count': 0}
+             for ingredient in serializer.data],
+        )
     
     def test_ingredients_limited_to_user(self):
         """Test list of ingerdients is limited to authed user"""
@@ -62,9 +68,9 @@ class PrivateIngredientsApiTests(TestCase):
         res = self.client.get(INGREDIENTS_URL)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data),1)
-        self.assertEqual(res.data[0]['name'], ingredient.name)
-        self.assertEqual(res.data[0]['id'], ingredient.id)
+        self.assertEqual(len(res.data['results']),1)
+        self.assertEqual(res.data['results'][0]['name'], ingredient.name)
+        self.assertEqual(res.data['results'][0]['id'], ingredient.id)
 
     def test_update_ingredient(self):
         """Test updating an ingredient"""
@@ -93,6 +99,25 @@ class PrivateIngredientsApiTests(TestCase):
         ingredients = Ingredient.objects.filter(user = self.user)
         self.assertFalse(ingredients.exists())
 
+    def test_filter_ingredients_assigned_to_recipes(self):
+        """Test listing ingredients used by recipes, with their counts"""
+        in1 = Ingredient.objects.create(user=self.user, name='Apples')
+        Ingredient.objects.create(user=self.user, name='Turkey')
+        recipe = Recipe.objects.create(
+            user=self.user,
+            title='Apple Crumble',
+            time_minutes=5,
+            price=Decimal('4.50'),
+        )
+        recipe.ingredients.add(in1)
+
+        res = self.client.get(INGREDIENTS_URL, {'assigned_only': 1})
+
+        self.assertEqual(
+            res.data['results'],
+            [{'id': in1.id, 'name': 'Apples', 'recipe_count': 1}],
+        )
+
     # def test_(self):
     #     """"""
 
@@ -0,0 +1,204 @@
+"""
+Tests for streaming recipe image uploads
+"""
+import hashlib
+import io
+import os
+import tracemalloc
+from decimal import Decimal
+from unittest.mock import patch
+
+from PIL import Image
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import (
+    APIClient,
+    APIRequestFactory,
+    force_authenticate,
+)
+
+from core.models import Recipe
+from core.tests.utils import TempMediaRootMixin
+from recipe.images import image_storage
+from recipe.uploads import (
+    UPLOAD_TEMP_DIR,
+    ImageHeaderParser,
+    StreamedImageFile,
+)
+from recipe.views import RecipeViewSet
+
+
+def image_upload_url(recipe_id):
+    """Create and return a recipe image upload url"""
+    return reverse('recipe:recipe-upload-image', args=[recipe_id])
+
+
+def image_bytes(format, size=(40, 30), **options):
+    """Return an encoded image"""
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color=(10, 120, 30)).save(buffer, format, **options)
+    return buffer.getvalue()
+
+
+def with_padding(jpeg, segments):
+    """Return jpeg with large APP15 segments before the frame header"""
+    padding = (b'\xff\xef' + (65535).to_bytes(2, 'big') + b'\0' * 65533)
+    return jpeg[:2] + padding * segments + jpeg[2:]
+
+
+def upload_file(content, name='photo.jpg'):
+    upload = io.BytesIO(content)
+    upload.name = name
+    return upload
+
+
+class ImageHeaderParserTests(TestCase):
+    """Test reading image sizes from partial headers"""
+
+    def parse(self, data, chunk_size=1):
+        parser = ImageHeaderParser()
+        for start in range(0, len(data), chunk_size):
+            result = parser.feed(data[start:start + chunk_size])
+            if result:
+                return result
+
+    def test_formats(self):
+        """Test the size of each supported format is found"""
+        images = {
+            'JPEG': image_bytes('JPEG'),
+            'PNG': image_bytes('PNG'),
+            'GIF': image_bytes('GIF'),
+            'WEBP': image_bytes('WEBP'),
+        }
+        for format, data in images.items():
+            with self.subTest(format=format):
+                self.assertEqual(self.parse(data), (format, 40, 30))
+
+        self.assertEqual(
+            self.parse(image_bytes('WEBP', lossless=True)),
+            ('WEBP', 40, 30),
+        )
+
+    def test_jpeg_metadata_skipped(self):
+        """Test large jpeg segments are skipped without buffering them"""
+        data = with_padding(image_bytes('JPEG'), segments=3)
+        parser = ImageHeaderParser()
+
+        self.assertIsNone(parser.feed(data[:100000]))
+        self.assertLess(len(parser._buffer), 8)
+        self.assertEqual(parser.feed(data[100000:]), ('JPEG', 40, 30))
+
+    def test_invalid_data(self):
+        """Test bytes that aren't a supported image raise ValueError"""
+        for data in (b'not an image', b'\xff\xd8\xff\xda\0\x08',
+                     b'GIF00a0000', image_bytes('BMP')):
+            with self.subTest(data=data[:10]):
+                with self.assertRaises(ValueError):
+                    self.parse(data, chunk_size=len(data))
+
+
+class StreamingUploadTests(TempMediaRootMixin, TestCase):
+    """Test uploading recipe images through the streaming handler"""
+
+    def setUp(self):
+        super().setUp()
+
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(
+            user=self.user,
+            title='Sample recipe',
+            time_minutes=10,
+            price=Decimal('1.00'),
+        )
+
+    def upload(self, content, name='photo.jpg'):
+        return self.client.post(
+            image_upload_url(self.recipe.id),
+            {'image': upload_file(content, name)},
+            format='multipart',
+        )
+
+    def temp_files(self):
+        return os.listdir(image_storage().path(UPLOAD_TEMP_DIR))
+
+    def test_upload_stored_by_hash(self):
+        """Test the streamed file is stored under the hash of its bytes"""
+        content = image_bytes('PNG')
+
+        res = self.upload(content, name='photo.PNG')
+
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.recipe.refresh_from_db()
+        digest = hashlib.sha256(content).hexdigest()
+        self.assertEqual(
+            self.recipe.image.name,
+            f'uploads/recipe/{digest[:2]}/{digest}.png',
+        )
+        with self.recipe.image.open('rb') as stored:
+            self.assertEqual(stored.read(), content)
+        self.assertEqual(self.temp_files(), [])
+
+    def test_not_an_image_rejected(self):
+        """Test a file that isn't an image is rejected"""
+        res = self.upload(b'just some text' * 1000, name='photo.txt')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('valid image', res.data['image'][0])
+        self.recipe.refresh_from_db()
+        self.assertFalse(self.recipe.image)
+        self.assertEqual(self.temp_files(), [])
+
+    def test_truncated_image_rejected(self):
+        """Test an upload ending before its header does is rejected"""
+        res = self.upload(with_padding(image_bytes('JPEG'), 2)[:100000])
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.temp_files(), [])
+
+    @override_settings(IMAGE_UPLOAD_MAX_PIXELS=1000)
+    def test_too_many_pixels_rejected_early(self):
+        """Test oversized images are rejected before they are written"""
+        content = with_padding(image_bytes('JPEG', size=(100, 100)), 1)
+
+        with patch.object(
+            StreamedImageFile, 'write', autospec=True
+        ) as patched_write:
+            res = self.upload(content)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('100x100', res.data['image'][0])
+        # the header was in the second chunk, only the first was written
+        self.assertEqual(patched_write.call_count, 1)
+
+    def test_upload_memory_bounded(self):
+        """Test peak memory while receiving an upload stays small"""
+        content = with_padding(image_bytes('JPEG'), segments=128)
+        request = APIRequestFactory().post(
+            image_upload_url(self.recipe.id),
+            {'image': upload_file(content)},
+            format='multipart',
+        )
+        force_authenticate(request, user=self.user)
+        # the test client would close the uploaded files after the response
+        self.addCleanup(request.close)
+        view = RecipeViewSet.as_view({'post': 'upload_image'})
+
+        tracemalloc.start()
+        try:
+            res = view(request, pk=self.recipe.id)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.assertGreater(len(content), 8 * 2 ** 20)
+        self.assertLess(peak, 1 * 2 ** 20)
@@ -0,0 +1,232 @@
+"""
+Tests for resizing recipe images on request
+"""
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from unittest.mock import Mock
+
+from PIL import Image
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.signals import request_finished
+from django.db import close_old_connections
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe
+from core.tests.utils import TempMediaRootMixin
+from recipe.images import image_storage
+from recipe.resize import RenditionCache
+from user.tests.test_login import throttle_rates
+
+
+def media_url(name):
+    """Create and return the url of a media file"""
+    return reverse('media', args=[name])
+
+
+def close_response(res):
+    """Close a streamed response, keeping the test's database connection"""
+    # like the test client does, request_finished would close_old_connections
+    # in the middle of the test transaction
+    request_finished.disconnect(close_old_connections)
+    try:
+        res.close()
+    finally:
+        request_finished.connect(close_old_connections)
+
+
+class RenditionCacheTests(SimpleTestCase):
+    """Test the disk cache of resized images"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_created_once(self):
+        """Test a cached key is not created again"""
+        cache = RenditionCache(self.directory, 1000)
+        create = Mock(return_value=b'resized')
+
+        path = cache.get_or_create('abc-100.webp', create)
+        self.assertEqual(cache.get_or_create('abc-100.webp', create), path)
+
+        create.assert_called_once()
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), b'resized')
+
+    def test_least_recently_used_evicted(self):
+        """Test going over the limit deletes the least recently used files"""
+        cache = RenditionCache(self.directory, 250)
+        paths = [
+            cache.get_or_create(f'key{i}', lambda: b'x' * 100)
+            for i in range(2)
+        ]
+        # make key0 the most recently used
+        past = time.time() - 60
+        os.utime(paths[1], (past, past))
+        self.assertIsNotNone(cache.get('key0'))
+
+        cache.get_or_create('key2', lambda: b'x' * 100)
+
+        self.assertIsNotNone(cache.get('key0'))
+        self.assertIsNone(cache.get('key1'))
+        self.assertIsNotNone(cache.get('key2'))
+
+    def test_stampede_encodes_once(self):
+        """Test concurrent misses for one key create it once"""
+        cache = RenditionCache(self.directory, 1000)
+        calls = []
+
+        def create():
+            calls.append(1)
+            time.sleep(0.1)
+            return b'resized'
+
+        threads = [
+            threading.Thread(
+                target=cache.get_or_create, args=('abc-100.webp', create)
+            )
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+
+
+@override_settings(
+    IMAGE_RESIZE_ACCEL_REDIRECT_URL='',
+    IMAGE_RESIZE_WIDTHS=[150, 300, 2000],
+)
+class ResizeEndpointTests(TempMediaRootMixin, TestCase):
+    """Test the resize parameters of the media endpoint"""
+
+    def media_settings(self, media_root):
+        return {
+            **super().media_settings(media_root),
+            'IMAGE_RESIZE_CACHE_DIR': os.path.join(media_root, 'cache'),
+        }
+
+    def setUp(self):
+        super().setUp()
+        caches[settings.RECIPE_CACHE_ALIAS].clear()
+
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        buffer = io.BytesIO()
+        Image.new('RGB', (800, 600), color=(200, 30, 30)).save(buffer, 'JPEG')
+        self.image = image_storage().save(
+            'uploads/recipe/photo.jpg', ContentFile(buffer.getvalue())
+        )
+        Recipe.objects.create(
+            user=self.user,
+            title='Sample recipe',
+            time_minutes=10,
+            price=Decimal('1.00'),
+            image=self.image,
+        )
+
+    def get_image(self, params):
+        res = self.client.get(media_url(self.image), params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        content = b''.join(res.streaming_content)
+        close_response(res)
+        return res, Image.open(io.BytesIO(content))
+
+    def test_resized(self):
+        """Test the image is resized to the width and format asked for"""
+        res, img = self.get_image({'width': 300, 'format': 'jpg'})
+
+        self.assertEqual(img.format, 'JPEG')
+        self.assertEqual(img.size, (300, 225))
+        self.assertEqual(res['Content-Type'], 'image/jpeg')
+        self.assertIn('immutable', res['Cache-Control'])
+        self.assertIn('max-age=31536000', res['Cache-Control'])
+
+    def test_webp_by_default_never_upscaled(self):
+        """Test webp is the default format and small images keep their size"""
+        res, img = self.get_image({'width': 1600})
+
+        self.assertEqual(img.format, 'WEBP')
+        self.assertEqual(img.size, (800, 600))
+
+    def test_width_rounded_up(self):
+        """Test widths are rounded up to the next allowed width"""
+        _, img = self.get_image({'width': 200})
+        self.assertEqual(img.size, (300, 225))
+
+        with self.settings(IMAGE_RESIZE_ACCEL_REDIRECT_URL='/protected/r/'):
+            res = self.client.get(media_url(self.image), {'width': 100000})
+
+        stem = os.path.splitext(os.path.basename(self.image))[0]
+        self.assertEqual(
+            res['X-Accel-Redirect'],
+            f'/protected/r/{stem[:2]}/{stem}-2000.webp',
+        )
+
+    def test_accel_redirect(self):
+        """Test nginx is told to send the cached file"""
+        with self.settings(IMAGE_RESIZE_ACCEL_REDIRECT_URL='/protected/r/'):
+            res = self.client.get(media_url(self.image), {'width': 100})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        stem = os.path.splitext(os.path.basename(self.image))[0]
+        self.assertEqual(
+            res['X-Accel-Redirect'],
+            f'/protected/r/{stem[:2]}/{stem}-150.webp',
+        )
+
+    def test_invalid_params(self):
+        """Test bad widths and formats are rejected"""
+        for params in (
+            {'width': 0},
+            {'width': 'wide'},
+            {'width': -300},
+            {'format': 'webp'},
+            {'width': 100, 'format': 'bmp'},
+        ):
+            res = self.client.get(media_url(self.image), params)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_other_users_image_not_found(self):
+        """Test other users can't resize someone's image"""
+        other = get_user_model().objects.create_user(
+            'other@example.com',
+            'password123',
+        )
+        self.client.force_authenticate(other)
+
+        res = self.client.get(media_url(self.image), {'width': 100})
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(REST_FRAMEWORK=throttle_rates(image_resize='2/min'))
+    def test_cache_misses_throttled(self):
+        """Test resizing new renditions is limited, cached ones are not"""
+        self.get_image({'width': 150})
+        self.get_image({'width': 300})
+
+        res = self.client.get(media_url(self.image), {'width': 2000})
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', res)
+
+        for _ in range(3):
+            self.get_image({'width': 150})
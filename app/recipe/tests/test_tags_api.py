@@ -2,6 +2,8 @@
 Tests for the tags api
 """
 
+from decimal import Decimal
+
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django.test import TestCase
@@ -9,7 +11,7 @@ from django.test import TestCase
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from core.models import Tag
+from core.models import Recipe, Tag
 from recipe.serializers import TagSerializer
 
 TAGS_URL = reverse('recipe:tag-list')
@@ -48,11 +50,14 @@ class PrivateTagsApiTests(TestCase):
 
         res = self.client.get(TAGS_URL)
 
-        tags = Tag.objects.all().order_by('-name')
+        tags = Tag.objects.all().order_by('-id')
         serializer = TagSerializer(tags, many=True)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(
+            res.data['results'],
+            [{**tag, 'recipe_count': 0} for tag in serializer.data],
+        )
 
     def test_tags_limited_to_user(self):
         """Test list of tags is limited to authenticated user"""
@@ -63,9 +68,9 @@ class PrivateTagsApiTests(TestCase):
         res = self.client.get(TAGS_URL)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data),1)
-        self.assertEqual(res.data[0]['name'], tag.name)
-        self.assertEqual(res.data[0]['id'], tag.id)
+        self.assertEqual(len(res.data['results']),1)
+        self.assertEqual(res.data['results'][0]['name'], tag.name)
+        self.assertEqual(res.data['results'][0]['id'], tag.id)
 
     def test_update_tag(self):
         """Tests updating a tag"""
@@ -79,6 +84,17 @@ class PrivateTagsApiTests(TestCase):
         tag.refresh_from_db()
         self.assertEqual(tag.name, payload['name'])
 
+    def test_update_tag_duplicate_name_error(self):
+        """Test renaming a tag to a name the user already has fails"""
+        Tag.objects.create(user=self.user, name='Dessert')
+        tag = Tag.objects.create(user=self.user, name='after dinner')
+
+        res = self.client.patch(detail_url(tag.id), {'name': 'Dessert'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        tag.refresh_from_db()
+        self.assertEqual(tag.name, 'after dinner')
+
     def test_delete_tag(self):
         """Test deleting a tag"""
         tag = Tag.objects.create(user=self.user, name='Breakfast')
@@ -89,4 +105,58 @@ class PrivateTagsApiTests(TestCase):
         tags = Tag.objects.filter(user=self.user)
         self.assertFalse(tags.exists())
 
+    def create_recipe(self, *tags):
+        recipe = Recipe.objects.create(
+            user=self.user,
+            title='Sample',
+            time_minutes=5,
+            price=Decimal('1.00'),
+        )
+        recipe.tags.add(*tags)
+        return recipe
+
+    def test_tags_recipe_count(self):
+        """Test tags report how many recipes use them"""
+        popular = Tag.objects.create(user=self.user, name='Popular')
+        rare = Tag.objects.create(user=self.user, name='Rare')
+        Tag.objects.create(user=self.user, name='Unused')
+        self.create_recipe(popular, rare)
+        self.create_recipe(popular)
+
+        res = self.client.get(TAGS_URL)
+
+        counts = {
+            tag['name']: tag['recipe_count'] for tag in res.data['results']
+        }
+        self.assertEqual(counts, {'Popular': 2, 'Rare': 1, 'Unused': 0})
 
+    def test_filter_tags_assigned_to_recipes(self):
+        """Test assigned_only lists only tags used by recipes"""
+        tag1 = Tag.objects.create(user=self.user, name='Breakfast')
+        Tag.objects.create(user=self.user, name='Lunch')
+        self.create_recipe(tag1)
+        self.create_recipe(tag1)
+
+        res = self.client.get(TAGS_URL, {'assigned_only': 1})
+
+        self.assertEqual(
+            res.data['results'],
+            [{'id': tag1.id, 'name': 'Breakfast', 'recipe_count': 2}],
+        )
+
+    def test_assigned_only_invalid(self):
+        """Test assigned_only must be 0 or 1"""
+        res = self.client.get(TAGS_URL, {'assigned_only': 'yes'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_tags_etag_changes_with_count(self):
+        """Test linking a recipe changes the etag of the tags list"""
+        tag = Tag.objects.create(user=self.user, name='Dinner')
+        etag = self.client.get(TAGS_URL)['ETag']
+        self.create_recipe(tag)
+
+        res = self.client.get(TAGS_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'][0]['recipe_count'], 1)
@@ -0,0 +1,28 @@
+"""
+Throttles for the recipe apis
+"""
+from django.conf import settings
+from django.core.cache import caches
+
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class ResizeThrottle(SimpleRateThrottle):
+    """Limit the images a user has resized that weren't cached yet"""
+    scope = 'image_resize'
+
+    @property
+    def cache(self):
+        # shared by the workers when RECIPE_CACHE_BACKEND is
+        return caches[settings.RECIPE_CACHE_ALIAS]
+
+    @property
+    def THROTTLE_RATES(self):
+        return api_settings.DEFAULT_THROTTLE_RATES
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {
+            'scope': self.scope,
+            'ident': request.user.pk,
+        }
@@ -0,0 +1,247 @@
+"""
+Streaming upload handling for recipe images
+"""
+import hashlib
+import os
+import struct
+import tempfile
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile, UploadedFile
+from django.core.files.uploadhandler import (
+    FileUploadHandler,
+    SkipFile,
+    StopFutureHandlers,
+)
+
+from recipe.images import image_storage
+
+# partial uploads are written next to the stored images, so keeping one is
+# a rename on the same volume
+UPLOAD_TEMP_DIR = os.path.join('uploads', 'tmp')
+
+INVALID_IMAGE = (
+    'Upload a valid image. The file you uploaded was either not an image '
+    'or a corrupted image.'
+)
+
+# jpeg start of frame markers, the ones carrying the image size
+JPEG_SOF = {
+    0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7,
+    0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF,
+}
+# markers without a length field
+JPEG_STANDALONE = {0x01, 0xD8, *range(0xD0, 0xD8)}
+
+
+class ImageHeaderParser:
+    """Find the format and size of an image in its bytes as they arrive
+
+    Only the few bytes of the header being parsed are buffered, large
+    jpeg metadata segments are skipped without keeping them. Supports
+    JPEG, PNG, GIF and WEBP.
+    """
+
+    def __init__(self):
+        self.result = None
+        self._buffer = bytearray()
+        self._steps = self._parse()
+        # > 0 reads that many bytes, < 0 skips them
+        self._wanted = next(self._steps)
+
+    def feed(self, data):
+        """Parse the next chunk, return (format, width, height) once known
+
+        Raises ValueError as soon as the bytes can't be an image.
+        """
+        view = memoryview(data)
+        while self.result is None:
+            if self._wanted < 0:
+                skipped = min(-self._wanted, len(view))
+                self._wanted += skipped
+                view = view[skipped:]
+                if self._wanted < 0:
+                    break
+                self._advance(b'')
+            else:
+                missing = self._wanted - len(self._buffer)
+                self._buffer += view[:missing]
+                view = view[missing:]
+                if len(self._buffer) < self._wanted:
+                    break
+                data = bytes(self._buffer)
+                self._buffer.clear()
+                self._advance(data)
+
+        return self.result
+
+    def _advance(self, data):
+        try:
+            self._wanted = self._steps.send(data)
+        except StopIteration as stop:
+            format, width, height = stop.value
+            if not width or not height:
+                raise ValueError('Image has no size.')
+            self.result = stop.value
+
+    def _parse(self):
+        signature = yield 2
+        if signature == b'\xff\xd8':
+            return (yield from self._parse_jpeg())
+        if signature == b'\x89P':
+            return (yield from self._parse_png(signature))
+        if signature == b'GI':
+            return (yield from self._parse_gif(signature))
+        if signature == b'RI':
+            return (yield from self._parse_webp(signature))
+        raise ValueError('Unsupported image format.')
+
+    def _parse_jpeg(self):
+        while True:
+            marker = yield 2
+            if marker[0] != 0xFF:
+                raise ValueError('Invalid jpeg marker.')
+            code = marker[1]
+            while code == 0xFF:
+                # fill bytes before the marker code
+                code = (yield 1)[0]
+            if code in JPEG_STANDALONE:
+                continue
+            if code in (0xD9, 0xDA):
+                raise ValueError('Jpeg image data before the frame header.')
+            length, = struct.unpack('>H', (yield 2))
+            if code in JPEG_SOF:
+                if length < 7:
+                    raise ValueError('Invalid jpeg frame header.')
+                frame = yield 5
+                height, width = struct.unpack('>HH', frame[1:])
+                return 'JPEG', width, height
+            if length < 2:
+                raise ValueError('Invalid jpeg segment.')
+            yield -(length - 2)
+
+    def _parse_png(self, head):
+        header = head + (yield 22)
+        if header[:8] != b'\x89PNG\r\n\x1a\n' or header[12:16] != b'IHDR':
+            raise ValueError('Invalid png header.')
+        width, height = struct.unpack('>II', header[16:24])
+        return 'PNG', width, height
+
+    def _parse_gif(self, head):
+        header = head + (yield 8)
+        if header[:6] not in (b'GIF87a', b'GIF89a'):
+            raise ValueError('Invalid gif header.')
+        width, height = struct.unpack('<HH', header[6:10])
+        return 'GIF', width, height
+
+    def _parse_webp(self, head):
+        header = head + (yield 28)
+        if header[:4] != b'RIFF' or header[8:12] != b'WEBP':
+            raise ValueError('Invalid webp header.')
+        chunk, data = header[12:16], header[20:]
+        if chunk == b'VP8X':
+            # canvas size minus one, 24 bit little endian
+            width = int.from_bytes(data[4:7], 'little') + 1
+            height = int.from_bytes(data[7:10], 'little') + 1
+        elif chunk == b'VP8 ' and data[3:6] == b'\x9d\x01\x2a':
+            width, height = struct.unpack('<HH', data[6:10])
+            width, height = width & 0x3FFF, height & 0x3FFF
+        elif chunk == b'VP8L' and data[0] == 0x2F:
+            bits = int.from_bytes(data[1:5], 'little')
+            width = (bits & 0x3FFF) + 1
+            height = ((bits >> 14) & 0x3FFF) + 1
+        else:
+            raise ValueError('Invalid webp header.')
+        return 'WEBP', width, height
+
+
+class StreamedImageFile(TemporaryUploadedFile):
+    """An image upload written to the media volume while it was received
+
+    sha256 and image_size are filled in as the data arrives, so neither
+    the storage nor validation have to read the file again.
+    """
+
+    def __init__(self, name, content_type, charset, content_type_extra=None):
+        directory = image_storage().path(UPLOAD_TEMP_DIR)
+        os.makedirs(directory, exist_ok=True)
+        file = tempfile.NamedTemporaryFile(suffix='.upload', dir=directory)
+        UploadedFile.__init__(
+            self, file, name, content_type, 0, charset, content_type_extra
+        )
+        self.sha256 = hashlib.sha256()
+        self.image_format = None
+        self.image_size = None
+
+
+class StreamingImageUploadHandler(FileUploadHandler):
+    """Stream image uploads to disk, rejecting bad ones from their header
+
+    Nothing but the current chunk is held in memory. The image header is
+    parsed as it arrives, so uploads that aren't images or have too many
+    pixels are dropped before the rest of their body is written.
+    """
+    chunk_size = 64 * 2 ** 10
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        # field name -> messages of rejected files
+        self.errors = {}
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.parser = ImageHeaderParser()
+        self.file = StreamedImageFile(
+            self.file_name,
+            self.content_type,
+            self.charset,
+            self.content_type_extra,
+        )
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.parser.result is None:
+            try:
+                self.check_header(raw_data)
+            except ValueError as e:
+                self.errors.setdefault(self.field_name, []).append(str(e))
+                # the parser closes self.file and discards the rest
+                raise SkipFile()
+        self.file.write(raw_data)
+        self.file.sha256.update(raw_data)
+
+    def check_header(self, raw_data):
+        """Feed the header parser, raise ValueError for unusable images"""
+        try:
+            result = self.parser.feed(raw_data)
+        except ValueError:
+            raise ValueError(INVALID_IMAGE)
+        if result is None:
+            return
+        format, width, height = result
+        if width * height > settings.IMAGE_UPLOAD_MAX_PIXELS:
+            raise ValueError(
+                f'Image is {width}x{height}, at most '
+                f'{settings.IMAGE_UPLOAD_MAX_PIXELS} pixels are allowed.'
+            )
+        self.file.image_format = format
+        self.file.image_size = (width, height)
+
+    def file_complete(self, file_size):
+        if self.parser.result is None:
+            # ended before the header did
+            self.errors.setdefault(self.field_name, []).append(INVALID_IMAGE)
+            self.file.close()
+            return None
+        self.file.seek(0)
+        self.file.size = file_size
+        return self.file
+
+
+def upload_errors(request):
+    """Return the errors of files the upload handlers rejected"""
+    errors = {}
+    for handler in request.upload_handlers:
+        for field_name, messages in getattr(handler, 'errors', {}).items():
+            errors.setdefault(field_name, []).extend(messages)
+    return errors
@@ -2,10 +2,16 @@
 Views for the recipes apis
 """
 
-from rest_framework.authentication import TokenAuthentication
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import StreamingHttpResponse
+
+from rest_framework.exceptions import ValidationError
+from rest_framework.negotiation import DefaultContentNegotiation
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
 from drf_spectacular.utils import (
     extend_schema_view,
@@ -26,11 +32,50 @@ from core.models import (
     Ingredient
 )
 
+from core.routers import ReplicaReadMixin
+from user.authentication import CachedTokenAuthentication
+
 from recipe import serializers
+from recipe.cache import CachedResponseMixin
+from recipe.conditional import (
+    ConditionalListMixin,
+    ConditionalRetrieveMixin,
+)
+from recipe.export import CSVRenderer, EXPORT_FORMATS, NDJSONRenderer
+from recipe.filters import RecipeSearchFilter
+from recipe.media import resize_params, serve_media, serve_resized
+from recipe.images import release_image, schedule_image_processing
+from recipe.pagination import IdCursorPagination
+from recipe.querysets import (
+    annotate_link_count,
+    filter_by_related,
+    filter_linked,
+    get_prefetch_fields,
+    iterate_in_chunks,
+    only_for_serializer,
+    prefetch_for_serializer,
+)
+from recipe.uploads import StreamingImageUploadHandler, upload_errors
+
+FIELD_SELECTION_PARAMETERS = [
+    OpenApiParameter(
+        'fields',
+        OpenApiTypes.STR,
+        description='Comma separated list of fields to return, '
+                    'e.g. id,title'
+    ),
+    OpenApiParameter(
+        'expand',
+        OpenApiTypes.STR,
+        description='Comma separated list of detail fields (description, '
+                    'image) to add to the default fields'
+    ),
+]
 
 @extend_schema_view(
+    retrieve=extend_schema(parameters=FIELD_SELECTION_PARAMETERS),
     list=extend_schema(
-        parameters = [
+        parameters = FIELD_SELECTION_PARAMETERS + [
             OpenApiParameter(
                 'tags',
                 OpenApiTypes.STR,
@@ -40,17 +85,30 @@ from recipe import serializers
                 'ingredients',
                 OpenApiTypes.STR,
                 description='Comma separated list of ingredient IDs to filter'
-            )
+            ),
+            OpenApiParameter(
+                'match',
+                OpenApiTypes.STR,
+                enum=['any', 'all'],
+                description='Match recipes with any (default) or all of the '
+                            'listed tags and ingredients'
+            ),
         ]
     )
 )
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ReplicaReadMixin,
+                    CachedResponseMixin,
+                    ConditionalListMixin,
+                    ConditionalRetrieveMixin,
+                    viewsets.ModelViewSet):
     """View for manage recipe api's"""
 
     serializer_class = serializers.RecipeDetailSerializer
     queryset = Recipe.objects.all()
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    pagination_class = IdCursorPagination
+    filter_backends = [RecipeSearchFilter]
     # need to be authenticated to use api's
 
     def _params_to_ints(self, qs):
@@ -62,19 +120,69 @@ class RecipeViewSet(viewsets.ModelViewSet):
         """Retrieve recipes for authenticated user."""
         tags = self.request.query_params.get('tags')
         ingredients = self.request.query_params.get('ingredients')
-        queryset = self.queryset
+        match = self.request.query_params.get('match', 'any')
+        if match not in ('any', 'all'):
+            raise ValidationError({'match': ['Must be "any" or "all".']})
+        match_all = match == 'all'
+
+        queryset = self.queryset.filter(user=self.request.user)
         if tags:
             tag_ids = self._params_to_ints(tags)
-            queryset = queryset.filter(tags__id__in=tag_ids)
+            queryset = filter_by_related(queryset, 'tags', tag_ids, match_all)
         if ingredients:
             ingredient_ids = self._params_to_ints(ingredients)
-            queryset = queryset.filter(ingredients__id__in=ingredient_ids)
+            queryset = filter_by_related(
+                queryset, 'ingredients', ingredient_ids, match_all
+            )
+        queryset = queryset.order_by('-id')
 
-        return queryset.filter(
-            user=self.request.user
-        ).order_by('-id').distinct()
+        # only prefetch what the serializer for this action will render
+        serializer = self.get_serializer()
+        if self.action in ('list', 'retrieve'):
+            # and skip unrendered columns; not for writes, since saving an
+            # instance with deferred fields only saves the loaded ones
+            queryset = only_for_serializer(queryset, serializer)
+        return prefetch_for_serializer(queryset, serializer)
 
+    def _query_param_list(self, name):
+        """Return the comma separated values of a query parameter"""
+        value = self.request.query_params.get(name, '')
+        return [item for item in value.split(',') if item]
 
+    def get_selected_fields(self):
+        """Return the fields asked for with fields=/expand=, or None"""
+        fields = self._query_param_list('fields')
+        expand = self._query_param_list('expand')
+        if not fields and not expand:
+            return None
+
+        available = serializers.RecipeDetailSerializer.Meta.fields
+        unknown = [name for name in fields + expand if name not in available]
+        if unknown:
+            raise ValidationError(
+                {'fields': [f'Unknown fields: {", ".join(unknown)}.']}
+            )
+        if fields:
+            return fields
+        if self.action == 'list':
+            default = serializers.RecipeSerializer.Meta.fields
+        else:
+            default = available
+        return default + [name for name in expand if name not in default]
+
+    def get_serializer(self, *args, **kwargs):
+        """Pass the selected fields to list and detail serializers"""
+        if self.action in ('list', 'retrieve'):
+            kwargs.setdefault('fields', self.get_selected_fields())
+        return super().get_serializer(*args, **kwargs)
+
+    def initialize_request(self, request, *args, **kwargs):
+        drf_request = super().initialize_request(request, *args, **kwargs)
+        if self.action == 'upload_image':
+            # stream the image to disk and check its header on the way,
+            # instead of buffering it and decoding it during validation
+            request.upload_handlers = [StreamingImageUploadHandler(request)]
+        return drf_request
 
     def get_serializer_class(self):
         # returns reference to the class
@@ -82,10 +190,16 @@ class RecipeViewSet(viewsets.ModelViewSet):
         # list is show all``
         # self.action holds the action defined in the suffix of the reverse url in the test file
         if self.action == 'list':
+            selected = self.get_selected_fields() or []
+            # the list serializer lacks the detail only fields
+            if set(selected) - set(serializers.RecipeSerializer.Meta.fields):
+                return serializers.RecipeDetailSerializer
             return serializers.RecipeSerializer
         # custom action upload_image
         elif self.action == 'upload_image':
             return serializers.RecipeImageSerializer
+        elif self.action == 'image_status':
+            return serializers.RecipeImageStatusSerializer
         
         return self.serializer_class
 
@@ -98,33 +212,232 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def upload_image(self, request, pk=None):
         """Upload an image to recipe"""
         recipe = self.get_object()
+        old_image = recipe.image.name
         serializer = self.get_serializer(recipe, data=request.data)
+        errors = upload_errors(request)
+        if errors:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
 
         if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            # resizing and re-encoding happen on the image worker pool
+            serializer.save(
+                image_status=Recipe.ImageStatus.PENDING,
+                image_renditions={},
+            )
+            schedule_image_processing(recipe.id)
+            if old_image and old_image != recipe.image.name:
+                transaction.on_commit(lambda: release_image(old_image))
+            return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-class BaseRecipeAttrViewSet(mixins.UpdateModelMixin,
+    @action(methods=['GET'], detail=True, url_path='image-status')
+    def image_status(self, request, pk=None):
+        """Return the processing status and renditions of a recipe image"""
+        serializer = self.get_serializer(self.get_object())
+        return Response(serializer.data)
+
+    @extend_schema(
+        responses={(200, 'application/x-ndjson'): OpenApiTypes.STR,
+                   (200, 'text/csv'): OpenApiTypes.STR},
+    )
+    @action(
+        methods=['GET'],
+        detail=False,
+        url_path='export',
+        renderer_classes=[NDJSONRenderer, CSVRenderer],
+    )
+    def export(self, request):
+        """Stream every matching recipe as NDJSON or CSV"""
+        # ?format=csv or an Accept header picks the renderer
+        export_format = request.accepted_renderer.format
+        queryset = self.filter_queryset(self.get_queryset())
+        serializer = self.get_serializer()
+        chunks = iterate_in_chunks(
+            queryset,
+            settings.RECIPE_EXPORT_CHUNK_SIZE,
+            get_prefetch_fields(serializer),
+        )
+        items = (
+            self.get_serializer(chunk, many=True).data for chunk in chunks
+        )
+        response = StreamingHttpResponse(
+            EXPORT_FORMATS[export_format](items),
+            content_type=request.accepted_renderer.media_type,
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="recipes.{export_format}"'
+        )
+        return response
+
+    def _bulk_items(self, request):
+        """Return the list of items in a bulk request body"""
+        items = request.data
+        if not isinstance(items, list) or not items:
+            raise ValidationError({
+                'non_field_errors': ['Expected a non-empty list of items.']
+            })
+        if len(items) > settings.RECIPE_BULK_MAX_ITEMS:
+            raise ValidationError({'non_field_errors': [
+                f'At most {settings.RECIPE_BULK_MAX_ITEMS} items per request.'
+            ]})
+        return items
+
+    def _bulk_instances(self, ids):
+        """Return the user's recipes for ids in order, with per-item errors"""
+        recipes = Recipe.objects.filter(user=self.request.user).in_bulk(
+            [recipe_id for recipe_id in ids if isinstance(recipe_id, int)]
+        )
+        errors = []
+        seen = set()
+        for recipe_id in ids:
+            if recipe_id not in recipes:
+                errors.append({'id': ['Recipe not found.']})
+            elif recipe_id in seen:
+                # a second payload would be merged into the first one
+                errors.append({'id': ['Duplicate id.']})
+            else:
+                errors.append({})
+                seen.add(recipe_id)
+        if any(errors):
+            raise ValidationError(errors)
+        return [recipes[recipe_id] for recipe_id in ids]
+
+    @extend_schema(
+        request=serializers.RecipeDetailSerializer(many=True),
+        responses=serializers.RecipeDetailSerializer(many=True),
+    )
+    @action(methods=['POST', 'PATCH', 'DELETE'], detail=False, url_path='bulk')
+    def bulk(self, request):
+        """Create, update or delete many recipes in one request"""
+        # all or nothing: any invalid item fails the request, and the errors
+        # list lines up with the submitted items
+        items = self._bulk_items(request)
+        if request.method == 'DELETE':
+            # a list of recipe ids
+            recipes = self._bulk_instances(items)
+            Recipe.objects.filter(
+                pk__in=[recipe.id for recipe in recipes]
+            ).delete()
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
+        if request.method == 'POST':
+            serializer = self.get_serializer(data=items, many=True)
+            serializer.is_valid(raise_exception=True)
+            serializer.save(user=request.user)
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+        # PATCH: a list of partial recipes, each with its id
+        recipes = self._bulk_instances([
+            item.get('id') if isinstance(item, dict) else None
+            for item in items
+        ])
+        serializer = self.get_serializer(
+            recipes, data=items, many=True, partial=True
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data)
+
+@extend_schema_view(
+    list=extend_schema(
+        parameters=[
+            OpenApiParameter(
+                'assigned_only',
+                OpenApiTypes.INT,
+                enum=[0, 1],
+                description='Filter by items assigned to recipes'
+            ),
+        ]
+    )
+)
+class BaseRecipeAttrViewSet(ReplicaReadMixin,
+                            ConditionalListMixin,
+                            mixins.UpdateModelMixin,
                             mixins.DestroyModelMixin,
                             mixins.ListModelMixin, 
                             viewsets.GenericViewSet):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    pagination_class = IdCursorPagination
+    # recipe counts change the page without touching the rows
+    etag_fields = ('id', 'updated_at', 'recipe_count')
+    # Recipe field linking to the model, set by subclasses
+    recipe_field = None
 
     def get_queryset(self):
         """Filter queryset to authed user"""
-        return self.queryset.filter(user=self.request.user).order_by('-name')
+        field = Recipe._meta.get_field(self.recipe_field)
+        assigned_only = self.request.query_params.get('assigned_only', '0')
+        if assigned_only not in ('0', '1'):
+            raise ValidationError({'assigned_only': ['Must be 0 or 1.']})
+
+        queryset = self.queryset.filter(user=self.request.user)
+        if assigned_only == '1':
+            queryset = filter_linked(queryset, field)
+        queryset = annotate_link_count(queryset, field, 'recipe_count')
+
+        return queryset.order_by('-id')
+
+    def perform_update(self, serializer):
+        """Update the object, rejecting names the user already has."""
+        try:
+            with transaction.atomic():
+                serializer.save()
+        except IntegrityError:
+            raise ValidationError(
+                {'name': ['You already have an item with this name.']}
+            )
 
 # due to crud:
 class TagViewSet(BaseRecipeAttrViewSet):
     """Manage tags in the database"""
-    serializer_class = serializers.TagSerializer
+    serializer_class = serializers.TagCountSerializer
     queryset = Tag.objects.all()
+    recipe_field = 'tags'
 
 class IngredientViewSet(BaseRecipeAttrViewSet):
     """Manage ingredients in the database"""
-    serializer_class = serializers.IngredientSerializer
+    serializer_class = serializers.IngredientCountSerializer
     queryset = Ingredient.objects.all()
-    
\ No newline at end of file
+    recipe_field = 'ingredients'
+    
+
+
+class MediaNegotiation(DefaultContentNegotiation):
+    """Render errors as json, ?format= picks the image format here"""
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+@extend_schema(
+    parameters=[
+        OpenApiParameter(
+            'width',
+            OpenApiTypes.INT,
+            description='Resize the image to this width, rounded up to one '
+                        'of the allowed widths and never upscaled',
+        ),
+        OpenApiParameter(
+            'format',
+            OpenApiTypes.STR,
+            enum=['webp', 'jpg'],
+            description='Format of the resized image, webp by default',
+        ),
+    ],
+    responses={(200, 'image/*'): OpenApiTypes.BINARY},
+)
+class MediaView(APIView):
+    """Serve uploaded images to the users whose recipes use them"""
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    content_negotiation_class = MediaNegotiation
+
+    def get(self, request, name):
+        """Authorize the request, nginx sends the file"""
+        params = request.query_params
+        if 'width' in params or 'format' in params:
+            width, ext = resize_params(params)
+            return serve_resized(request, name, width, ext)
+        return serve_media(request.user, name)
@@ -0,0 +1,84 @@
+"""
+Authentication classes for the api
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from rest_framework.authentication import TokenAuthentication
+
+
+class TokenCache:
+    """Bounded, TTL evicted map of token key to (user, token)"""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached (user, token) for key, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, user, token = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            # least recently used entries are evicted first
+            self._entries.move_to_end(key)
+
+        # copies so a request changing its user cannot leak into others
+        return copy.copy(user), token
+
+    def set(self, key, user, token):
+        """Cache the user and token for key"""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, user, token)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        """Drop a single token"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_user(self, user_id):
+        """Drop every token belonging to a user"""
+        with self._lock:
+            for key in [key for key, (_, user, _) in self._entries.items()
+                        if user.pk == user_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# per process: invalidation signals only reach this worker, other workers
+# see the change once their entry expires, so keep the TTL short
+token_cache = TokenCache(
+    max_size=settings.TOKEN_AUTH_CACHE_SIZE,
+    ttl=settings.TOKEN_AUTH_CACHE_TTL,
+)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Token authentication that skips the token/user query on a cache hit"""
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is not None:
+            return cached
+
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(key, user, token)
+        return user, token
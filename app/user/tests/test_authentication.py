@@ -0,0 +1,103 @@
+"""
+Tests for the cached token authentication
+"""
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from user.authentication import TokenCache, token_cache
+
+ME_URL = reverse('user:me')
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """Test authenticating with cached tokens"""
+
+    def setUp(self):
+        token_cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email='test@example.com',
+            password='testpass123',
+            name='Test Name',
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return len(ctx.captured_queries)
+
+    def test_cache_hit_saves_query(self):
+        """Test a cached token skips the token lookup query"""
+        first = self.count_queries()
+        second = self.count_queries()
+
+        self.assertEqual(second, first - 1)
+
+    def test_deleted_token_rejected(self):
+        """Test deleting a token invalidates the cached entry"""
+        self.client.get(ME_URL)
+
+        self.token.delete()
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_rejected(self):
+        """Test changing the user invalidates their cached tokens"""
+        self.client.get(ME_URL)
+
+        self.user.is_active = False
+        self.user.save()
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_profile_update_visible(self):
+        """Test an update through the api is visible on the next request"""
+        self.client.get(ME_URL)
+
+        self.client.patch(ME_URL, {'name': 'New Name'})
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.data['name'], 'New Name')
+
+
+class TokenCacheTests(SimpleTestCase):
+    """Test the token cache eviction"""
+
+    def test_evicts_least_recently_used(self):
+        """Test the cache never grows beyond its size"""
+        cache = TokenCache(max_size=2, ttl=60)
+        user = get_user_model()(pk=1)
+        cache.set('a', user, 'a')
+        cache.set('b', user, 'b')
+        cache.get('a')
+
+        cache.set('c', user, 'c')
+
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('c'))
+
+    @patch('user.authentication.time.monotonic')
+    def test_expires_after_ttl(self, patched_monotonic):
+        """Test entries expire after the ttl"""
+        cache = TokenCache(max_size=10, ttl=60)
+        patched_monotonic.return_value = 100
+        cache.set('a', get_user_model()(pk=1), 'a')
+
+        patched_monotonic.return_value = 161
+
+        self.assertIsNone(cache.get('a'))
@@ -0,0 +1,144 @@
+"""
+Tests for password hashing and throttling of the token endpoint
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+TOKEN_URL = reverse('user:token')
+
+
+def throttle_rates(**rates):
+    """Return REST_FRAMEWORK settings with other login throttle rates"""
+    return {
+        **settings.REST_FRAMEWORK,
+        'DEFAULT_THROTTLE_RATES': {
+            **settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'],
+            **rates,
+        },
+    }
+
+
+class LoginTestCase(TestCase):
+    """Base class clearing the throttle history between tests"""
+
+    def setUp(self):
+        caches[settings.RECIPE_CACHE_ALIAS].clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='test@example.com',
+            password='testpass123',
+        )
+
+    def login(self, email='test@example.com', password='testpass123', **extra):
+        return self.client.post(
+            TOKEN_URL, {'email': email, 'password': password}, **extra
+        )
+
+
+class PasswordRehashTests(LoginTestCase):
+    """Test passwords are rehashed with the configured hasher on login"""
+
+    def test_new_passwords_use_argon2(self):
+        """Test new passwords are hashed with the tuned argon2 costs"""
+        self.assertTrue(self.user.password.startswith('argon2$argon2id$'))
+        self.assertIn('m=19456,t=2,p=1', self.user.password)
+
+    def test_pbkdf2_rehashed_on_login(self):
+        """Test an old pbkdf2 hash is replaced after a successful login"""
+        self.user.password = make_password(
+            'testpass123', hasher='pbkdf2_sha256'
+        )
+        self.user.save()
+
+        res = self.login()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('argon2$'))
+        self.assertTrue(self.user.check_password('testpass123'))
+
+    def test_failed_login_keeps_hash(self):
+        """Test a wrong password doesn't rehash"""
+        old_hash = make_password('testpass123', hasher='pbkdf2_sha256')
+        self.user.password = old_hash
+        self.user.save()
+
+        self.login(password='wrongpass')
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.password, old_hash)
+
+    @override_settings(PASSWORD_ARGON2_TIME_COST=3)
+    def test_changed_costs_rehashed_on_login(self):
+        """Test retuning the argon2 costs updates hashes on login"""
+        self.login()
+
+        self.user.refresh_from_db()
+        self.assertIn('t=3', self.user.password)
+
+    @override_settings(PASSWORD_HASHERS=[
+        'user.hashers.PBKDF2PasswordHasher',
+        'user.hashers.Argon2PasswordHasher',
+    ], PASSWORD_PBKDF2_ITERATIONS=1000)
+    def test_configured_pbkdf2(self):
+        """Test pbkdf2 can be configured as the preferred hasher"""
+        self.login()
+
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$1000$'))
+
+
+class LoginThrottleTests(LoginTestCase):
+    """Test the login throttles"""
+
+    @override_settings(REST_FRAMEWORK=throttle_rates(login_email='2/min'))
+    def test_email_throttled(self):
+        """Test attempts for one account are limited from any address"""
+        self.login(password='wrongpass', REMOTE_ADDR='10.0.0.1')
+        self.login(password='wrongpass', REMOTE_ADDR='10.0.0.2')
+
+        res = self.login(REMOTE_ADDR='10.0.0.3')
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', res)
+
+        res = self.login(email='Other@example.com', REMOTE_ADDR='10.0.0.3')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(REST_FRAMEWORK=throttle_rates(login_email='2/min'))
+    def test_email_case_shares_limit(self):
+        """Test changing the case of an email doesn't reset its limit"""
+        self.login(email='test@example.com')
+        self.login(email='TEST@example.com')
+
+        res = self.login(email=' Test@Example.com ')
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    @override_settings(REST_FRAMEWORK=throttle_rates(login_ip='2/min'))
+    def test_ip_throttled(self):
+        """Test attempts from one address are limited across accounts"""
+        self.login(email='a@example.com')
+        self.login(email='b@example.com')
+
+        res = self.login()
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+        res = self.login(REMOTE_ADDR='10.0.0.9')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    @override_settings(REST_FRAMEWORK=throttle_rates(login_ip='2/min'))
+    def test_forwarded_for_ignored(self):
+        """Test a forged X-Forwarded-For doesn't give a fresh limit"""
+        for i in range(2):
+            self.login(HTTP_X_FORWARDED_FOR=f'10.1.0.{i}')
+
+        res = self.login(HTTP_X_FORWARDED_FOR='10.1.0.9')
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
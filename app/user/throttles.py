@@ -0,0 +1,48 @@
+"""
+Throttles for the token endpoint
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class LoginThrottle(SimpleRateThrottle):
+    """Rate limit logins before the password hasher runs"""
+
+    @property
+    def cache(self):
+        # shared by the workers when RECIPE_CACHE_BACKEND is, so the limits
+        # don't multiply with the number of processes
+        return caches[settings.RECIPE_CACHE_ALIAS]
+
+    @property
+    def THROTTLE_RATES(self):
+        return api_settings.DEFAULT_THROTTLE_RATES
+
+
+class LoginIPThrottle(LoginThrottle):
+    """Limit login attempts per client address"""
+    scope = 'login_ip'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {
+            'scope': self.scope,
+            'ident': self.get_ident(request),
+        }
+
+
+class LoginEmailThrottle(LoginThrottle):
+    """Limit login attempts per account, from any address"""
+    scope = 'login_email'
+
+    def get_cache_key(self, request, view):
+        email = request.data.get('email')
+        if not isinstance(email, str) or not email.strip():
+            # rejected by the serializer without hashing anything
+            return None
+        ident = hashlib.sha256(email.strip().lower().encode()).hexdigest()
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
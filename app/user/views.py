@@ -2,10 +2,12 @@
 Views of the user api
 """
 
-from rest_framework import generics, authentication, permissions
+from rest_framework import generics, permissions
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.settings import api_settings
 
+from user.authentication import CachedTokenAuthentication
+from user.throttles import LoginEmailThrottle, LoginIPThrottle
 from user.serializers import (
     UserSerializer,
     AuthTokenSerializer
@@ -20,11 +22,13 @@ class CreateTokenView(ObtainAuthToken):
     """Create a new auth token for user."""
     serializer_class = AuthTokenSerializer
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
+    # checked before authenticate() spends CPU on the password hash
+    throttle_classes = [LoginIPThrottle, LoginEmailThrottle]
 
 class ManageUserView(generics.RetrieveUpdateAPIView):
     """Manage the authenticated user."""
     serializer_class = UserSerializer
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
     def get_object(self):
@@ -1,10 +1,36 @@
 server {
     listen ${LISTEN_PORT};
 
+    # uploads are private, the app serves them from /api/media/
+    location /static/media/ {
+        return 404;
+    }
+
+    # resized image cache, also only served through the app
+    location /static/cache/ {
+        return 404;
+    }
+
     location /static {
         alias /vol/static;
     }
 
+    # only reachable through X-Accel-Redirect from the app, after it
+    # checked the user may see the file
+    location /protected/media/ {
+        internal;
+        alias /vol/static/media/;
+        sendfile on;
+        tcp_nopush on;
+    }
+
+    location /protected/resized/ {
+        internal;
+        alias /vol/static/cache/images/;
+        sendfile on;
+        tcp_nopush on;
+    }
+
     location / {
         uwsgi_pass              ${APP_HOST}:${APP_PORT};
         include                 /etc/nginx/uwsgi_params;